@@ -58,3 +58,65 @@ with app.app_context():
             db.text("ALTER TABLE cdr_file ADD COLUMN spec_path VARCHAR(255)")
         )
         db.session.commit()
+    if "file_metadata" not in columns:
+        db.session.execute(
+            db.text("ALTER TABLE cdr_file ADD COLUMN file_metadata TEXT")
+        )
+        db.session.commit()
+    if "record_type_counts" not in columns:
+        db.session.execute(
+            db.text("ALTER TABLE cdr_file ADD COLUMN record_type_counts TEXT")
+        )
+        db.session.commit()
+    if "content_hash" not in columns:
+        db.session.execute(
+            db.text("ALTER TABLE cdr_file ADD COLUMN content_hash VARCHAR(64)")
+        )
+        db.session.commit()
+
+    record_columns = [col["name"] for col in inspector.get_columns("cdr_record")]
+    if "raw_data_z" not in record_columns:
+        blob_type = "BYTEA" if db.engine.dialect.name == "postgresql" else "BLOB"
+        db.session.execute(
+            db.text(f"ALTER TABLE cdr_record ADD COLUMN raw_data_z {blob_type}")
+        )
+        db.session.commit()
+    for column in ("record_offset", "record_length"):
+        if column not in record_columns:
+            db.session.execute(
+                db.text(f"ALTER TABLE cdr_record ADD COLUMN {column} INTEGER")
+            )
+            db.session.commit()
+    for column in ("start_epoch", "end_epoch"):
+        if column not in record_columns:
+            db.session.execute(
+                db.text(f"ALTER TABLE cdr_record ADD COLUMN {column} BIGINT")
+            )
+            db.session.commit()
+
+    for table in ("ingest_job", "edit_session"):
+        lease_columns = [col["name"] for col in inspector.get_columns(table)]
+        for column, column_type in (("owner", "VARCHAR(100)"), ("heartbeat_at", "TIMESTAMP")):
+            if column not in lease_columns:
+                db.session.execute(
+                    db.text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                )
+                db.session.commit()
+
+    # Indexes added after the table was first created
+    for index in models.CDRRecord.__table__.indexes | models.CDRFile.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+    from search import init_search
+
+    init_search()
+
+    # Background ingest jobs do not survive the process that ran them
+    from ingest import recover_jobs
+
+    recover_jobs()
+
+    # Edit sessions whose journal was being applied when the process stopped
+    from edit_sessions import recover_sessions
+
+    recover_sessions()
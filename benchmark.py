@@ -0,0 +1,407 @@
+"""Parser throughput benchmarks on synthetic CallEventDataFile containers.
+
+``generate`` writes a Huawei-style CDR file of a given size and record mix::
+
+    python benchmark.py generate /tmp/cdr-100mb.dat --size 100MB
+
+``run`` generates (or reuses) files of each size and times every CDRParser
+entry point on them, one fresh process per measurement so that peak RSS is
+per entry point. Results are printed as JSON::
+
+    python benchmark.py run --size 1MB,100MB --output bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from cdr_parser import (
+    CDRParser,
+    TAG_CLASS_CONTEXT,
+    TAG_CLASS_UNIVERSAL,
+    CONTAINER_HEADER_TAG,
+    CONTAINER_RECORDS_TAG,
+    CONTAINER_TRAILER_TAG,
+    CONTAINER_EXTENSIONS_TAG,
+    encode_tlv_header,
+    encode_tbcd,
+)
+
+DIAMOND_SPEC = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "attached_assets",
+    "Telenor_Huawei_MSC_V0.3 4.xml",
+)
+
+# Distinct records generated per file; the file repeats them in random order
+RECORD_POOL_SIZE = 4096
+
+# CallEventRecord alternative -> (context tag, fields as (tag, value kind)),
+# following the field tags of the Diamond decoder XML
+RECORD_LAYOUTS = {
+    "moCallRecord": (0, (
+        (0, "record_type"), (1, "imsi"), (2, "imei"), (3, "msisdn"),
+        (4, "msisdn"), (5, "msisdn"), (9, "msc"), (12, "location"),
+        (22, "seizure_time"), (23, "answer_time"), (24, "release_time"),
+        (25, "duration"), (30, "cause"), (32, "call_reference"),
+    )),
+    "mtCallRecord": (1, (
+        (0, "record_type"), (1, "imsi"), (2, "imei"), (3, "msisdn"),
+        (4, "msisdn"), (6, "msc"), (9, "location"), (19, "seizure_time"),
+        (20, "answer_time"), (21, "release_time"), (22, "duration"),
+        (27, "cause"), (29, "call_reference"),
+    )),
+    "roamingRecord": (2, (
+        (0, "record_type"), (1, "imsi"), (2, "msisdn"), (3, "msisdn"),
+        (4, "msisdn"), (5, "msc"), (12, "seizure_time"), (13, "answer_time"),
+        (14, "release_time"), (15, "duration"), (17, "cause"),
+        (19, "call_reference"),
+    )),
+    "moSMSRecord": (6, (
+        (0, "record_type"), (1, "imsi"), (2, "imei"), (3, "msisdn"),
+        (5, "msisdn"), (6, "msc"), (7, "location"), (9, "release_time"),
+        (12, "msisdn"), (201, "call_reference"),
+    )),
+    "mtSMSRecord": (7, (
+        (0, "record_type"), (1, "msisdn"), (2, "imsi"), (3, "imei"),
+        (4, "msisdn"), (6, "msc"), (7, "location"), (8, "release_time"),
+        (202, "call_reference"),
+    )),
+    "ssActionRecord": (10, (
+        (0, "record_type"), (1, "imsi"), (2, "imei"), (3, "msisdn"),
+        (5, "msc"), (6, "location"), (10, "release_time"),
+        (13, "call_reference"),
+    )),
+    "hlrIntRecord": (11, (
+        (0, "record_type"), (1, "imsi"), (2, "msisdn"), (3, "msc"),
+        (6, "release_time"), (169, "call_reference"),
+    )),
+}
+
+# Share of each record type in uploads/test_cdr.dat
+DEFAULT_MIX = {
+    "mtSMSRecord": 77,
+    "mtCallRecord": 6,
+    "moCallRecord": 6,
+    "hlrIntRecord": 5,
+    "ssActionRecord": 3,
+    "roamingRecord": 2,
+    "moSMSRecord": 1,
+}
+
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "B": 1}
+
+
+def parse_size(text):
+    """Parse ``"500KB"``, ``"1MB"``, ``"5GB"`` or a plain byte count."""
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * factor)
+    return int(text)
+
+
+def parse_mix(text):
+    """Parse ``"mtSMSRecord=77,moCallRecord=6"`` into a weight mapping."""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in RECORD_LAYOUTS:
+            raise ValueError(
+                f"Unknown record type {name!r}; expected one of {', '.join(RECORD_LAYOUTS)}"
+            )
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def encode_field(tag_number, value, constructed=False):
+    return encode_tlv_header(TAG_CLASS_CONTEXT, constructed, tag_number, len(value)) + value
+
+
+def encode_integer(value):
+    return value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True)
+
+
+def encode_timestamp(moment):
+    """TimeStamp octets: BCD ``YYMMDDhhmmss`` followed by ``+hhmm``."""
+    return bytes.fromhex(moment.strftime("%y%m%d%H%M%S")) + b"+" + bytes.fromhex("0500")
+
+
+def encode_address(digits):
+    """AddressString: international E.164 indicator and TBCD digits."""
+    return b"\x91" + encode_tbcd(digits, (len(digits) + 1) // 2)
+
+
+class RecordGenerator:
+    """Encode random CallEventRecords of the types in ``mix``."""
+
+    def __init__(self, mix, seed=0, start=None):
+        self.rng = random.Random(seed)
+        self.types = list(mix)
+        self.weights = [mix[name] for name in self.types]
+        self.clock = start or datetime(2025, 3, 17, 7, 59, 7)
+
+    def digits(self, prefix, count):
+        return prefix + "".join(self.rng.choice("0123456789") for _ in range(count))
+
+    def value(self, kind, record_type, times):
+        rng = self.rng
+        if kind == "record_type":
+            return encode_integer(RECORD_LAYOUTS[record_type][0])
+        if kind == "imsi":
+            return encode_tbcd(self.digits("41006", 10), 8)
+        if kind == "imei":
+            return encode_tbcd(self.digits("35", 13), 8)
+        if kind == "msisdn":
+            return encode_address(self.digits("923", 9))
+        if kind == "msc":
+            return encode_address(self.digits("92300", 7))
+        if kind == "location":
+            return encode_field(0, rng.randbytes(2)) + encode_field(1, rng.randbytes(2))
+        if kind.endswith("_time"):
+            return encode_timestamp(times[kind])
+        if kind == "duration":
+            return encode_integer(int((times["release_time"] - times["answer_time"]).total_seconds()))
+        if kind == "cause":
+            return encode_integer(rng.choice((0, 0, 0, 1, 2, 3)))
+        if kind == "call_reference":
+            return rng.randbytes(6)
+        raise ValueError(f"Unknown field kind {kind}")
+
+    def record(self):
+        """Return the BER encoding of one record."""
+        record_type = self.rng.choices(self.types, self.weights)[0]
+        tag_number, fields = RECORD_LAYOUTS[record_type]
+        self.clock += timedelta(milliseconds=self.rng.randint(0, 400))
+        answer = self.clock + timedelta(seconds=self.rng.randint(2, 20))
+        times = {
+            "seizure_time": self.clock,
+            "answer_time": answer,
+            "release_time": answer + timedelta(seconds=self.rng.randint(0, 900)),
+        }
+        body = b"".join(
+            encode_field(tag, self.value(kind, record_type, times), kind == "location")
+            for tag, kind in fields
+        )
+        return encode_field(tag_number, body, constructed=True)
+
+
+def generate_file(path, size, mix=None, seed=0):
+    """Write a CallEventDataFile of about ``size`` bytes to ``path``.
+
+    Returns a summary dict with the number of records written.
+    """
+    generator = RecordGenerator(mix or DEFAULT_MIX, seed)
+    first_call = generator.clock
+    pool = [generator.record() for _ in range(RECORD_POOL_SIZE)]
+
+    # The same seeded sequence is replayed twice: once to size the
+    # container and once to write it, so lengths are known up front
+    def picks():
+        rng = random.Random(seed)
+        total = 0
+        while total < size:
+            record = pool[rng.randrange(RECORD_POOL_SIZE)]
+            total += len(record)
+            yield record
+
+    records_size = count = 0
+    for record in picks():
+        records_size += len(record)
+        count += 1
+
+    produced = encode_field(0, encode_timestamp(generator.clock))
+    entity = encode_field(1, encode_address("92300000001"))
+    header = encode_field(CONTAINER_HEADER_TAG, produced + entity, constructed=True)
+    trailer = encode_field(
+        CONTAINER_TRAILER_TAG,
+        produced
+        + entity
+        + encode_field(2, encode_timestamp(first_call))
+        + encode_field(3, encode_timestamp(generator.clock))
+        + encode_field(4, encode_integer(count)),
+        constructed=True,
+    )
+    extensions = encode_field(CONTAINER_EXTENSIONS_TAG, b"", constructed=True)
+    records_header = encode_tlv_header(
+        TAG_CLASS_CONTEXT, True, CONTAINER_RECORDS_TAG, records_size
+    )
+    body_size = len(header) + len(records_header) + records_size + len(trailer) + len(extensions)
+
+    with open(path, "wb") as out:
+        out.write(encode_tlv_header(TAG_CLASS_UNIVERSAL, True, 16, body_size))
+        out.write(header + records_header)
+        batch = []
+        for record in picks():
+            batch.append(record)
+            if len(batch) >= 8192:
+                out.write(b"".join(batch))
+                batch = []
+        out.write(b"".join(batch))
+        out.write(trailer + extensions)
+
+    return {"path": path, "bytes": os.path.getsize(path), "records": count}
+
+
+def _parse_all_chunks(parser, path):
+    records = []
+    start, offset = 0, 0
+    while True:
+        chunk, reached_end, offset = parser.parse_file_chunk(
+            path, start_record=start, max_records=1000, offset=offset
+        )
+        records.extend(chunk)
+        start += len(chunk)
+        if reached_end or not chunk:
+            return records
+
+
+# Entry point name -> (uses the Diamond spec, call)
+ENTRY_POINTS = {
+    "parse_file": (False, lambda parser, path: parser.parse_file(path)),
+    "parse_file_chunk": (False, _parse_all_chunks),
+    "parse_file_with_spec": (True, lambda parser, path: parser.parse_file_with_spec(path)[0]),
+    "parse_raw_binary_file": (False, lambda parser, path: parser.parse_raw_binary_file(path)),
+}
+
+
+def _peak_rss_mb(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(entry_point, path, spec_path):
+    """Time one entry point on ``path``; run in a fresh process."""
+    uses_spec, call = ENTRY_POINTS[entry_point]
+    parser = CDRParser(spec_path=spec_path if uses_spec else None)
+    started = time.perf_counter()
+    records = call(parser, path)
+    seconds = time.perf_counter() - started
+    return {
+        "records": len(records or ()),
+        "seconds": seconds,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_worker_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def run_benchmarks(sizes, entry_points, mix, seed, workdir, repeat, spec_path):
+    context = multiprocessing.get_context("spawn")
+    mix_key = hashlib.sha256(json.dumps(mix, sort_keys=True).encode()).hexdigest()[:8]
+    results = []
+    for size in sizes:
+        path = os.path.join(workdir, f"synthetic-{size}-{seed}-{mix_key}.dat")
+        if not os.path.exists(path):
+            generate_file(path, size, mix, seed)
+        file_bytes = os.path.getsize(path)
+
+        for entry_point in entry_points:
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(pool.submit(measure, entry_point, path, spec_path).result())
+            best = min(runs, key=lambda run: run["seconds"])
+            seconds = best["seconds"]
+            results.append(
+                {
+                    "entry_point": entry_point,
+                    "file_bytes": file_bytes,
+                    "records": best["records"],
+                    "seconds": round(seconds, 4),
+                    "records_per_second": round(best["records"] / seconds, 1) if seconds else None,
+                    "mb_per_second": round(file_bytes / (1024 * 1024) / seconds, 2) if seconds else None,
+                    "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+                    "peak_worker_rss_mb": max(run["peak_worker_rss_mb"] for run in runs),
+                    "all_seconds": [round(run["seconds"], 4) for run in runs],
+                }
+            )
+            print(
+                f"{entry_point:>22} {file_bytes / (1024 * 1024):9.1f} MB "
+                f"{results[-1]['records_per_second'] or 0:12.1f} rec/s "
+                f"{results[-1]['mb_per_second'] or 0:8.2f} MB/s "
+                f"{results[-1]['peak_rss_mb']:8.1f} MB RSS",
+                file=sys.stderr,
+            )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic CDR file")
+    generate.add_argument("path")
+    generate.add_argument("--size", default="1MB", help="target size, e.g. 1MB or 5GB")
+    generate.add_argument("--mix", help="record type weights, e.g. mtSMSRecord=77,moCallRecord=6")
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("run", help="time the parser entry points")
+    run.add_argument("--size", default="1MB,10MB", help="comma-separated file sizes")
+    run.add_argument("--entry-points", default=",".join(ENTRY_POINTS))
+    run.add_argument("--mix", help="record type weights, e.g. mtSMSRecord=77,moCallRecord=6")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--repeat", type=int, default=1, help="runs per measurement; the fastest is reported")
+    run.add_argument("--workers", type=int, help="PARSE_WORKERS for the parser processes")
+    run.add_argument("--spec", default=DIAMOND_SPEC, help="decoder spec for parse_file_with_spec")
+    run.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "cdr-bench"))
+    run.add_argument("--output", help="write the JSON report here instead of stdout")
+
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+
+    if args.command == "generate":
+        summary = generate_file(args.path, parse_size(args.size), mix, args.seed)
+        print(json.dumps(summary))
+        return
+
+    entry_points = [name.strip() for name in args.entry_points.split(",")]
+    unknown = set(entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(sorted(unknown))}")
+    if args.workers:
+        os.environ["PARSE_WORKERS"] = str(args.workers)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results = run_benchmarks(
+        [parse_size(size) for size in args.size.split(",")],
+        entry_points,
+        mix,
+        args.seed,
+        args.workdir,
+        args.repeat,
+        args.spec,
+    )
+    report = {
+        "created": datetime.utcnow().isoformat() + "Z",
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "parse_workers": os.environ.get("PARSE_WORKERS"),
+        },
+        "mix": mix,
+        "seed": args.seed,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
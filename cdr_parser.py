@@ -1,23 +1,1261 @@
 import os
 import re
+import json
+import mmap
+import errno
+import pickle
 import random
+import struct
+import hashlib
 import logging
-from datetime import datetime
+import threading
+import multiprocessing
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from datetime import date, datetime, timedelta
 from pyasn1.codec.der import decoder
 from pyasn1.codec.ber import decoder as ber_decoder
 from pyasn1 import error
 
+import metrics
+
 try:
     import asn1tools
 except Exception:  # pragma: no cover - optional dependency
     asn1tools = None
 
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - optional dependency
+    np = None
+
 try:
     import xml.etree.ElementTree as ET
 except Exception:  # pragma: no cover - optional dependency
     ET = None
 
 
+# BER tag classes as encoded in the two high bits of the identifier octet
+TAG_CLASS_UNIVERSAL = 0
+TAG_CLASS_APPLICATION = 1
+TAG_CLASS_CONTEXT = 2
+TAG_CLASS_PRIVATE = 3
+TAG_CLASS_NAMES = ("UNIVERSAL", "APPLICATION", "CONTEXT", "PRIVATE")
+
+# Filler octets some switches use to pad CDR files to a block size
+FILLER_BYTES = (0x00, 0xFF)
+
+# Longest identifier + length header read_tlv_header accepts
+MAX_TLV_HEADER = 16
+
+# Context tags of the Huawei/3GPP CallEventDataFile container
+# (see attached_assets/Telenor_Huawei_MSC_V0.3 4.xml)
+CONTAINER_HEADER_TAG = 0
+CONTAINER_RECORDS_TAG = 1
+CONTAINER_TRAILER_TAG = 2
+CONTAINER_EXTENSIONS_TAG = 3
+TRAILER_COUNT_TAG = 4  # noOfRecords
+
+HEADER_RECORD_FIELDS = {
+    0: "productionDateTime",
+    1: "recordingEntity",
+    2: "extensions",
+}
+
+# CHOICE alternatives of CallEventRecord keyed by context tag number
+CALL_EVENT_RECORD_CHOICES = {
+    0: "moCallRecord",
+    1: "mtCallRecord",
+    2: "roamingRecord",
+    3: "incGatewayRecord",
+    4: "outGatewayRecord",
+    5: "transitRecord",
+    6: "moSMSRecord",
+    7: "mtSMSRecord",
+    10: "ssActionRecord",
+    11: "hlrIntRecord",
+    13: "locUpdateVLRRecord",
+    14: "commonEquipRecord",
+    15: "recTypeExtensions",
+    16: "termCAMELRecord",
+    17: "mtLCSRecord",
+    18: "moLCSRecord",
+    19: "niLCSRecord",
+    20: "groupCallRecord",
+    96: "soCallRecord",
+    97: "stCallRecord",
+    98: "soSMSRecord",
+    99: "stSMSRecord",
+    100: "forwardCallRecord",
+}
+
+TRAILER_RECORD_FIELDS = {
+    0: "productionDateTime",
+    1: "recordingEntity",
+    2: "firstCallDateTime",
+    3: "lastCallDateTime",
+    4: "noOfRecords",
+    5: "extensions",
+}
+
+# Formats tried by parse_timestamp; a string with any other character than
+# the ones they are made of cannot match
+TIMESTAMP_FORMATS = (
+    "%Y%m%d%H%M%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y%m%d%H%M%S%f",
+    "%d/%m/%Y %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%SZ",
+)
+TIMESTAMP_CHARS = re.compile(r"[\d\s/:TZ-]+", re.IGNORECASE)
+
+# The expressions datetime.strptime uses for the directives above
+TIMESTAMP_DIRECTIVES = {
+    "Y": r"(?P<year>\d\d\d\d)",
+    "m": r"(?P<month>1[0-2]|0[1-9]|[1-9])",
+    "d": r"(?P<day>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])",
+    "H": r"(?P<hour>2[0-3]|[0-1]\d|\d)",
+    "M": r"(?P<minute>[0-5]\d|\d)",
+    "S": r"(?P<second>6[0-1]|[0-5]\d|\d)",
+    "f": r"(?P<microsecond>[0-9]{1,6})",
+}
+
+
+def compile_timestamp_format(fmt):
+    """Compile a ``strptime`` format made of TIMESTAMP_DIRECTIVES.
+
+    The expression matches what ``datetime.strptime(value, fmt)`` accepts
+    when it matches all of ``value`` with ``match``; strptime rebuilds its
+    expressions whenever its locale cache is invalidated, which made it the
+    bulk of field extraction.
+    """
+    parts = re.split(r"%(.)", fmt)
+    pattern = "".join(
+        TIMESTAMP_DIRECTIVES[part] if i % 2 else re.sub(r"\\\s+", r"\\s+", re.escape(part))
+        for i, part in enumerate(parts)
+    )
+    return re.compile(pattern, re.IGNORECASE)
+
+
+TIMESTAMP_PATTERNS = tuple(compile_timestamp_format(fmt) for fmt in TIMESTAMP_FORMATS)
+
+# Digit runs that form a whole word; phone numbers, durations and identifiers
+# are told apart by length
+DIGIT_WORD = re.compile(r"\b\d+\b")
+
+# Words in keys and values that classify a record, in order of precedence
+RECORD_TYPE_INDICATORS = (
+    ("voice_call", ("voice", "call", "speech", "gsm", "circuit")),
+    ("sms", ("sms", "message", "short", "text")),
+    ("data_session", ("data", "gprs", "pdp", "internet", "packet")),
+    ("mms", ("mms", "multimedia")),
+)
+
+# Identifier fields and the digit counts they are recognised by
+IDENTIFIER_LENGTHS = (
+    ("imsi", 15, 15),
+    ("imei", 14, 15),
+    ("cell_id", 4, 8),
+)
+
+MAX_PHONE_NUMBERS = 10
+MAX_TIMESTAMPS = 5
+MAX_DURATIONS = 3
+
+
+class _Key:
+    """A mapping key waiting on the scan_values stack behind its value."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, key):
+        self.text = key if isinstance(key, str) else repr(key)
+
+
+# Parallel parsing: target bytes of records per shard and default worker count
+PARSE_SHARD_BYTES = 8 * 1024 * 1024
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+
+
+class TLV(
+    namedtuple(
+        "TLV",
+        "offset header_length length tag_class constructed tag_number indefinite",
+    )
+):
+    """Position and identifier of one BER element inside a buffer."""
+
+    __slots__ = ()
+
+    @property
+    def value_offset(self):
+        return self.offset + self.header_length
+
+    @property
+    def value_end(self):
+        return self.value_offset + self.length
+
+    @property
+    def end(self):
+        # Indefinite-length values are terminated by two end-of-contents octets
+        return self.value_end + (2 if self.indefinite else 0)
+
+
+def read_tlv_header(data, offset):
+    """Decode the BER identifier and length octets at ``offset``.
+
+    Only the header is inspected, so the value does not need to be present
+    in ``data``. Returns ``(tag_class, constructed, tag_number,
+    header_length, value_length)`` where ``value_length`` is ``None`` for
+    an indefinite-length encoding. Raises ``ValueError`` when the header is
+    truncated or malformed.
+    """
+    size = len(data)
+    pos = offset
+    if pos >= size:
+        raise ValueError(f"No BER header at offset {offset}")
+
+    first = data[pos]
+    pos += 1
+    tag_class = first >> 6
+    constructed = bool(first & 0x20)
+    tag_number = first & 0x1F
+
+    if tag_number == 0x1F:
+        # High tag number form, e.g. ``9f 81 0d``: base-128 with continuation bit
+        tag_number = 0
+        while True:
+            if pos >= size:
+                raise ValueError(f"Truncated tag at offset {offset}")
+            octet = data[pos]
+            pos += 1
+            tag_number = (tag_number << 7) | (octet & 0x7F)
+            if not octet & 0x80:
+                break
+            if pos - offset > 6:
+                raise ValueError(f"Tag number too long at offset {offset}")
+
+    if pos >= size:
+        raise ValueError(f"Truncated length at offset {offset}")
+    length = data[pos]
+    pos += 1
+
+    if length == 0x80:
+        if not constructed:
+            raise ValueError(f"Indefinite primitive at offset {offset}")
+        return tag_class, constructed, tag_number, pos - offset, None
+
+    if length & 0x80:
+        # Long form, e.g. ``83 11 58 48``
+        count = length & 0x7F
+        if count > 8 or length == 0xFF:
+            raise ValueError(f"Unsupported length form at offset {offset}")
+        if pos + count > size:
+            raise ValueError(f"Truncated length at offset {offset}")
+        length = int.from_bytes(data[pos : pos + count], "big")
+        pos += count
+
+    return tag_class, constructed, tag_number, pos - offset, length
+
+
+def read_tlv(data, offset, end=None):
+    """Return the :class:`TLV` at ``offset`` or ``None`` if it is incomplete.
+
+    ``end`` bounds the element; an element whose value runs past it is
+    treated as incomplete rather than malformed so callers can read more
+    data and try again.
+    """
+    if end is None:
+        end = len(data)
+    tag_class, constructed, tag_number, header_length, length = read_tlv_header(
+        data, offset
+    )
+    if offset + header_length > end:
+        return None
+
+    indefinite = length is None
+    if indefinite:
+        length = _indefinite_length(data, offset + header_length, end)
+        if length is None:
+            return None
+    elif offset + header_length + length > end:
+        return None
+
+    return TLV(
+        offset, header_length, length, tag_class, constructed, tag_number, indefinite
+    )
+
+
+def _indefinite_length(data, start, end):
+    """Length of an indefinite value up to (not including) its EOC octets."""
+    pos = start
+    while pos + 2 <= end:
+        if data[pos] == 0 and data[pos + 1] == 0:
+            return pos - start
+        tlv = read_tlv(data, pos, end)
+        if tlv is None:
+            return None
+        pos = tlv.end
+    return None
+
+
+def encode_tlv_header(tag_class, constructed, tag_number, length):
+    """Encode the identifier and definite length octets of a BER element."""
+    first = tag_class << 6 | (0x20 if constructed else 0)
+    if tag_number < 0x1F:
+        identifier = bytes([first | tag_number])
+    else:
+        groups = []
+        while True:
+            groups.append(tag_number & 0x7F)
+            tag_number >>= 7
+            if not tag_number:
+                break
+        identifier = bytes(
+            [first | 0x1F] + [group | 0x80 for group in groups[:0:-1]] + groups[:1]
+        )
+    if length < 0x80:
+        return identifier + bytes([length])
+    size = (length.bit_length() + 7) // 8
+    return identifier + bytes([0x80 | size]) + length.to_bytes(size, "big")
+
+
+def splice_file_range(src_fd, dst_fd, offset, count):
+    """Append ``count`` bytes at ``offset`` of ``src_fd`` to ``dst_fd``.
+
+    The bytes are copied inside the kernel with ``os.copy_file_range`` or
+    ``os.sendfile`` where the platform and file systems allow it, otherwise
+    through a buffer.
+    """
+    for copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+        if copy is None:
+            continue
+        try:
+            while count:
+                if copy is os.sendfile:
+                    sent = os.sendfile(dst_fd, src_fd, offset, count)
+                else:
+                    sent = copy(src_fd, dst_fd, count, offset)
+                if not sent:
+                    raise ValueError("Unexpected end of file while copying records")
+                offset += sent
+                count -= sent
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+
+    while count:
+        chunk = os.pread(src_fd, min(count, 1024 * 1024), offset)
+        if not chunk:
+            raise ValueError("Unexpected end of file while copying records")
+        os.write(dst_fd, chunk)
+        offset += len(chunk)
+        count -= len(chunk)
+
+
+# Bytes scanned per vectorised BCD pass; bounds scratch memory on big files
+BCD_SCAN_BLOCK = 4 * 1024 * 1024
+
+# Sidecar record index: a header followed by one fixed-size entry per record
+INDEX_MAGIC = b"CDRIDX01"
+INDEX_HEADER = struct.Struct("<8sQ")  # magic, size of the indexed file
+INDEX_ENTRY = struct.Struct("<QIBI")  # offset, length, tag class, tag number
+
+
+class IndexEntry(namedtuple("IndexEntry", "offset length tag_class tag_number")):
+    """Location and CHOICE tag of one record in a CDR file."""
+
+    __slots__ = ()
+
+    @property
+    def alternative(self):
+        if self.tag_class != TAG_CLASS_CONTEXT:
+            return None
+        return CALL_EVENT_RECORD_CHOICES.get(self.tag_number)
+
+
+class RecordIndex:
+    """Random access to a sidecar index written by ``build_record_index``."""
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path)
+        self.count = (size - INDEX_HEADER.size) // INDEX_ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, number):
+        """Return the :class:`IndexEntry` of record ``number``."""
+        if not 0 <= number < self.count:
+            raise IndexError(f"Record {number} not in index")
+        with open(self.path, "rb") as f:
+            f.seek(INDEX_HEADER.size + number * INDEX_ENTRY.size)
+            return IndexEntry(*INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size)))
+
+    def entries(self, start=0, stop=None):
+        """Return the entries of records ``start`` to ``stop`` (exclusive)."""
+        stop = self.count if stop is None else min(stop, self.count)
+        if start >= stop:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(INDEX_HEADER.size + start * INDEX_ENTRY.size)
+            data = f.read((stop - start) * INDEX_ENTRY.size)
+        return [IndexEntry(*fields) for fields in INDEX_ENTRY.iter_unpack(data)]
+
+
+# Diamond decoder XML (e.g. attached_assets/Telenor_Huawei_MSC_V0.3 4.xml)
+DIAMOND_TAG_CLASSES = {
+    "universal": TAG_CLASS_UNIVERSAL,
+    "application": TAG_CLASS_APPLICATION,
+    "context": TAG_CLASS_CONTEXT,
+    "private": TAG_CLASS_PRIVATE,
+}
+
+# Universal tags used when a field carries no <Identifier>
+DIAMOND_NATURAL_TAGS = {
+    "boolean": 1,
+    "integer": 2,
+    "octetstring": 4,
+    "null": 5,
+    "ia5string": 22,
+    "ASN1Sequence": 16,
+    "ASN1SequenceOf": 16,
+    "ASN1Set": 17,
+    "ASN1SetOf": 17,
+}
+
+DIAMOND_CONSTRUCTED = {
+    "ASN1Sequence": "sequence",
+    "ASN1Set": "set",
+    "ASN1Choice": "choice",
+    "ASN1SequenceOf": "sequence_of",
+    "ASN1SetOf": "set_of",
+}
+
+# Mapping expressions that only copy a field, e.g. ``ToString(mtCallRecord.callDuration)``
+DIAMOND_FIELD_MAPPING = re.compile(
+    r"^(?:ToString\()?([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+)\)?$"
+)
+
+TBCD_DIGITS = "0123456789*#abc"
+
+
+def decode_integer(value):
+    return int.from_bytes(value, "big", signed=True)
+
+
+def decode_octets(value):
+    return bytes(value).hex()
+
+
+def decode_null(value):
+    return None
+
+
+def decode_boolean(value):
+    return any(value)
+
+
+def decode_tbcd(value, stop_at_filler=True):
+    """Decode nibble-swapped BCD digits, e.g. ``21 43 f5`` -> ``"12345"``."""
+    digits = []
+    for octet in value:
+        for nibble in (octet & 0x0F, octet >> 4):
+            if nibble == 0x0F:
+                if stop_at_filler:
+                    return "".join(digits)
+                continue
+            digits.append(TBCD_DIGITS[nibble])
+    return "".join(digits)
+
+
+def encode_tbcd(number, length):
+    """Encode ``number`` as ``length`` nibble-swapped BCD octets, F padded."""
+    nibbles = [TBCD_DIGITS.index(digit) for digit in number.lower()]
+    if len(nibbles) > 2 * length:
+        raise ValueError(f"{number} does not fit in {length} octets")
+    nibbles += [0x0F] * (2 * length - len(nibbles))
+    return bytes(lo | (hi << 4) for lo, hi in zip(nibbles[::2], nibbles[1::2]))
+
+
+def decode_text(value, encoding="ascii", strip=False):
+    text = bytes(value).decode(encoding, errors="replace")
+    return text.strip().strip('"') if strip else text
+
+
+def decode_address(value):
+    """Decode the digits of an AddressString or BCDDirectoryNumber.
+
+    The leading type-of-number octet is dropped, together with the
+    presentation octet that follows it when its extension bit is clear.
+    """
+    skip = 1 if not value or value[0] & 0x80 else 2
+    return decode_tbcd(value[skip:])
+
+
+def encode_address(number, value):
+    """Re-encode the address octets ``value`` with the digits of ``number``.
+
+    The type-of-number octets read by :func:`decode_address` are kept and
+    the digits are F padded to the same length, so the element keeps its
+    size. Raises ``ValueError`` if ``number`` does not fit.
+    """
+    skip = 1 if not value or value[0] & 0x80 else 2
+    if not number.isdigit() or len(value) <= skip:
+        raise ValueError(f"{number} cannot be encoded in {len(value)} address octets")
+    return bytes(value[:skip]) + encode_tbcd(number, len(value) - skip)
+
+
+# Value of each octet as two BCD digits, or -1 when a nibble is not a digit
+BCD_OCTETS = tuple(
+    (octet >> 4) * 10 + (octet & 0x0F) if octet >> 4 < 10 and octet & 0x0F < 10 else -1
+    for octet in range(256)
+)
+
+# TimeStamp-shaped octets in undecoded data: six octets in the BCD range,
+# the sign of the UTC offset and its hours and minutes
+BINARY_BCD_TIMESTAMP = re.compile(rb"[\x00-\x99]{6}[+\-][\x00-\x14][\x00-\x59]")
+
+# ASCII timestamps in undecoded data
+BINARY_TIMESTAMP_PATTERNS = tuple(
+    re.compile(pattern)
+    for pattern in (
+        rb"20[0-9]{12}",  # 20YYMMDDHHMMSS format
+        rb"[0-9]{12}",  # YYMMDDHHMMSS format
+        rb"[0-9]{10}",  # UNIX timestamp format
+        rb"[0-9]{8}",  # YYYYMMDD format
+    )
+)
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+UNIX_EPOCH_ORDINAL = UNIX_EPOCH.toordinal()
+
+# Dates (and UTC offsets) a TimestampDecoder remembers
+TIMESTAMP_CACHE_SIZE = 256
+
+
+class TimestampDecoder:
+    """Decode TimeStamp octets into UTC epoch seconds.
+
+    A TimeStamp holds ``YYMMDDhhmmss`` in BCD followed by the sign of the
+    UTC offset as an ASCII ``+``/``-`` and its ``hhmm`` in BCD, e.g.
+    ``25 03 17 01 29 07 2b 06 00``; without the offset octets the time is
+    taken as UTC. Calling the decoder returns ``(epoch, utc_offset)`` in
+    seconds. The epoch of midnight is cached per date and offset, so the
+    records of one file mostly cost a cache hit and three BCD lookups; the
+    parser clears its decoder at the start of every file.
+    """
+
+    def __init__(self, max_size=TIMESTAMP_CACHE_SIZE):
+        self.max_size = max_size
+        self.days = {}
+
+    def clear(self):
+        self.days.clear()
+
+    def __call__(self, value):
+        if len(value) < 6:
+            raise ValueError(f"Invalid TimeStamp {bytes(value).hex()}")
+        key = bytes(value[0:3]) + bytes(value[6:9])
+        day = self.days.get(key)
+        if day is None:
+            day = self._decode_day(value)
+            if len(self.days) >= self.max_size:
+                self.days.clear()
+            self.days[key] = day
+        midnight, utc_offset = day
+        hour, minute, second = BCD_OCTETS[value[3]], BCD_OCTETS[value[4]], BCD_OCTETS[value[5]]
+        if not (0 <= hour <= 23 and 0 <= minute <= 59 and 0 <= second <= 59):
+            raise ValueError(f"Invalid TimeStamp {bytes(value).hex()}")
+        return midnight + hour * 3600 + minute * 60 + second, utc_offset
+
+    @staticmethod
+    def _decode_day(value):
+        year, month, day = BCD_OCTETS[value[0]], BCD_OCTETS[value[1]], BCD_OCTETS[value[2]]
+        if min(year, month, day) < 0:
+            raise ValueError(f"Invalid TimeStamp {bytes(value).hex()}")
+        utc_offset = 0
+        if len(value) >= 9 and value[6] in b"+-":
+            hours, minutes = BCD_OCTETS[value[7]], BCD_OCTETS[value[8]]
+            if not (0 <= hours <= 14 and 0 <= minutes <= 59):
+                raise ValueError(f"Invalid TimeStamp offset {bytes(value).hex()}")
+            utc_offset = hours * 3600 + minutes * 60
+            if value[6] == 0x2D:
+                utc_offset = -utc_offset
+        ordinal = date(2000 + year, month, day).toordinal()
+        return (ordinal - UNIX_EPOCH_ORDINAL) * 86400 - utc_offset, utc_offset
+
+
+def epoch_to_local(epoch, utc_offset=0):
+    """Naive local time of ``epoch`` at ``utc_offset`` seconds from UTC."""
+    return UNIX_EPOCH + timedelta(seconds=epoch + utc_offset)
+
+
+def decode_cell_id(value):
+    return str(int.from_bytes(value, "big"))
+
+
+# Canonical record fields and how their octets are decoded. The timestamp
+# fields of EPOCH_FIELDS are decoded by a TimestampDecoder of each parser,
+# see field_decoders().
+FIELD_DECODERS = {
+    "calling_number": decode_address,
+    "called_number": decode_address,
+    "call_duration": decode_integer,
+    "imsi": decode_tbcd,
+    "imei": decode_tbcd,
+    "cell_id": decode_cell_id,
+}
+
+# Fields that can be rewritten in place and how their octets are encoded
+FIELD_ENCODERS = {
+    "calling_number": encode_address,
+    "called_number": encode_address,
+}
+
+# Timestamp fields and the field holding their UTC epoch
+EPOCH_FIELDS = {"start_time": "start_epoch", "end_time": "end_epoch"}
+
+
+def field_decoders(timestamps=None):
+    """Return the decoders of all canonical fields.
+
+    The timestamp fields use ``timestamps``, or a new TimestampDecoder, so
+    its cache is never shared between parsers or threads.
+    """
+    if timestamps is None:
+        timestamps = TimestampDecoder()
+    return dict(FIELD_DECODERS, **dict.fromkeys(EPOCH_FIELDS, timestamps))
+
+# Tag paths of the canonical fields inside each kind of CallEventRecord,
+# relative to its CHOICE element (see attached_assets/Telenor_Huawei_MSC_V0.3
+# 4.xml). Where several paths map to one field the first present one wins.
+FIELD_MAPPING_PROFILES = {
+    "moc": {
+        "[4]": "calling_number",  # callingNumber
+        "[3]": "calling_number",  # servedMSISDN
+        "[5]": "called_number",  # calledNumber
+        "[23]": "start_time",  # answerTime
+        "[22]": "start_time",  # seizureTime
+        "[24]": "end_time",  # releaseTime
+        "[25]": "call_duration",  # callDuration
+        "[1]": "imsi",  # servedIMSI
+        "[2]": "imei",  # servedIMEI
+        "[12]/[1]": "cell_id",  # location.cellIdentifier
+    },
+    "mtc": {
+        "[4]": "calling_number",  # callingNumber
+        "[205]": "called_number",  # calledNumber
+        "[3]": "called_number",  # servedMSISDN
+        "[20]": "start_time",  # answerTime
+        "[19]": "start_time",  # seizureTime
+        "[21]": "end_time",  # releaseTime
+        "[22]": "call_duration",  # callDuration
+        "[1]": "imsi",  # servedIMSI
+        "[2]": "imei",  # servedIMEI
+        "[9]/[1]": "cell_id",  # location.cellIdentifier
+    },
+    "mo_sms": {
+        "[3]": "calling_number",  # servedMSISDN
+        "[12]": "called_number",  # destinationNumber
+        "[9]": "start_time",  # originationTime
+        "[1]": "imsi",  # servedIMSI
+        "[2]": "imei",  # servedIMEI
+        "[7]/[1]": "cell_id",  # location.cellIdentifier
+    },
+    "mt_sms": {
+        "[4]": "called_number",  # servedMSISDN
+        "[8]": "start_time",  # deliveryTime
+        "[2]": "imsi",  # servedIMSI
+        "[3]": "imei",  # servedIMEI
+        "[7]/[1]": "cell_id",  # location.cellIdentifier
+    },
+    "forwarding": {
+        "[4]": "calling_number",  # callingNumber
+        "[3]": "calling_number",  # servedMSISDN
+        "[5]": "called_number",  # calledNumber
+        "[23]": "start_time",  # answerTime
+        "[22]": "start_time",  # seizureTime
+        "[24]": "end_time",  # releaseTime
+        "[25]": "call_duration",  # callDuration
+        "[1]": "imsi",  # servedIMSI
+        "[2]": "imei",  # servedIMEI
+        "[12]/[1]": "cell_id",  # location.cellIdentifier
+    },
+}
+
+# Mapping profile of each CallEventRecord CHOICE tag
+RECORD_TYPE_PROFILES = {
+    0: "moc",
+    1: "mtc",
+    6: "mo_sms",
+    7: "mt_sms",
+    100: "forwarding",
+}
+
+TAG_KEY = re.compile(r"\[(?:(UNIVERSAL|APPLICATION|CONTEXT|PRIVATE) )?(\d+)\]")
+
+
+def parse_tag_path(path):
+    """Split ``"[12]/[1]"`` into ``[(tag_class, tag_number), ...]``."""
+    keys = []
+    for part in path.split("/"):
+        match = TAG_KEY.fullmatch(part.strip())
+        if match is None:
+            raise ValueError(f"Invalid tag {part!r} in path {path!r}")
+        tag_class = match.group(1)
+        keys.append(
+            (
+                TAG_CLASS_NAMES.index(tag_class) if tag_class else TAG_CLASS_CONTEXT,
+                int(match.group(2)),
+            )
+        )
+    return keys
+
+
+class FieldMapping:
+    """Canonical fields read from fixed tag paths of each record type.
+
+    ``profiles`` maps a profile name to ``{tag path: field}`` and
+    ``record_types`` maps CallEventRecord CHOICE tags to profile names. The
+    paths are compiled into trees keyed by ``(tag_class, tag_number)``, so
+    mapping a record takes one dict lookup per element of the record.
+    """
+
+    def __init__(self, profiles=None, record_types=None):
+        self.profiles = FIELD_MAPPING_PROFILES if profiles is None else profiles
+        self.record_types = RECORD_TYPE_PROFILES if record_types is None else record_types
+        self.trees = {
+            int(tag): self._compile(self.profiles[name])
+            for tag, name in self.record_types.items()
+        }
+        # Record types whose fields are read from, and patched at, tag paths
+        self.mapped_record_types = {
+            CALL_EVENT_RECORD_CHOICES.get(tag, f"[{tag}]") for tag in self.trees
+        }
+
+    @staticmethod
+    def _compile(profile):
+        tree = {}
+        for priority, (path, field) in enumerate(profile.items()):
+            if field not in FIELD_DECODERS and field not in EPOCH_FIELDS:
+                raise ValueError(f"Unknown field {field!r} mapped from {path!r}")
+            *parents, leaf = parse_tag_path(path)
+            node = tree
+            for key in parents:
+                node = node.setdefault(key, {})
+                if not isinstance(node, dict):
+                    raise ValueError(f"Tag path {path!r} runs through a mapped field")
+            node[leaf] = (field, priority)
+        return tree
+
+    def extract(self, data, decoders=None):
+        """Return ``(record_type, fields)`` of the record in ``data``.
+
+        ``record_type`` is the CallEventRecord CHOICE alternative of the
+        record's tag. Record types without a profile get no fields; ``None``
+        is returned only when ``data`` is not a CHOICE alternative. ``decoders``
+        comes from :func:`field_decoders`; parsers pass theirs so the
+        TimeStamp cache lasts for a whole file.
+        Timestamps are returned as naive local times with their UTC epoch
+        in the matching EPOCH_FIELDS field.
+        """
+        tlv = read_tlv(data, 0)
+        if tlv is None or tlv.tag_class != TAG_CLASS_CONTEXT or not tlv.constructed:
+            return None
+        record_type = CALL_EVENT_RECORD_CHOICES.get(tlv.tag_number, f"[{tlv.tag_number}]")
+        tree = self.trees.get(tlv.tag_number)
+        if tree is None:
+            return record_type, {}
+        found = {}
+        try:
+            self._walk(
+                data, tlv.value_offset, tlv.value_end, tree, found, decoders or field_decoders()
+            )
+        except ValueError:
+            pass  # keep the fields before a malformed element
+        fields = {field: value for field, (_, value) in found.items()}
+        for field, epoch_field in EPOCH_FIELDS.items():
+            if field in fields:
+                epoch, utc_offset = fields[field]
+                fields[field] = epoch_to_local(epoch, utc_offset)
+                fields[epoch_field] = epoch
+        return record_type, fields
+
+    def _walk(self, data, offset, end, tree, found, decoders):
+        pos = offset
+        while pos < end:
+            tlv = read_tlv(data, pos, end)
+            if tlv is None:
+                return
+            pos = tlv.end
+            node = tree.get((tlv.tag_class, tlv.tag_number))
+            if node is None:
+                continue
+            if isinstance(node, dict):
+                if tlv.constructed:
+                    self._walk(data, tlv.value_offset, tlv.value_end, node, found, decoders)
+                continue
+            field, priority = node
+            if field in found and found[field][0] <= priority:
+                continue
+            try:
+                value = decoders[field](bytes(data[tlv.value_offset : tlv.value_end]))
+            except ValueError:
+                continue
+            if value is not None and value != "":
+                found[field] = (priority, value)
+
+
+    def locate(self, data, field, decoders=None):
+        """Return the TLV of the element ``field`` is read from in ``data``.
+
+        The element is chosen as :meth:`extract` chooses it. Returns ``None``
+        when the record type has no profile or no element holds ``field``,
+        and raises ``ValueError`` when the winning tag path occurs more than
+        once, so callers never have to guess which element to rewrite.
+        """
+        tlv = read_tlv(data, 0)
+        if tlv is None or tlv.tag_class != TAG_CLASS_CONTEXT or not tlv.constructed:
+            return None
+        tree = self.trees.get(tlv.tag_number)
+        if tree is None:
+            return None
+        found = []
+        decode = (decoders or field_decoders())[field]
+        self._find(data, tlv.value_offset, tlv.value_end, tree, field, decode, found)
+        if not found:
+            return None
+        priority = min(priority for priority, _ in found)
+        matches = [tlv for p, tlv in found if p == priority]
+        if len(matches) > 1:
+            raise ValueError(f"{field} is held by {len(matches)} elements of the record")
+        return matches[0]
+
+    def _find(self, data, offset, end, tree, field, decode, found):
+        pos = offset
+        while pos < end:
+            tlv = read_tlv(data, pos, end)
+            if tlv is None:
+                return
+            pos = tlv.end
+            node = tree.get((tlv.tag_class, tlv.tag_number))
+            if node is None:
+                continue
+            if isinstance(node, dict):
+                if tlv.constructed:
+                    self._find(data, tlv.value_offset, tlv.value_end, node, field, decode, found)
+                continue
+            if node[0] != field:
+                continue
+            try:
+                value = decode(bytes(data[tlv.value_offset : tlv.value_end]))
+            except ValueError:
+                continue
+            if value is not None and value != "":
+                found.append((node[1], tlv))
+
+
+def load_field_mapping(path=None):
+    """Build a :class:`FieldMapping` from a JSON file, or the defaults.
+
+    The file holds ``{"profiles": {...}, "record_types": {...}}`` in the
+    shape of FIELD_MAPPING_PROFILES and RECORD_TYPE_PROFILES; either key may
+    be left out to keep the default.
+    """
+    if not path:
+        return FieldMapping()
+    with open(path) as f:
+        config = json.load(f)
+    return FieldMapping(config.get("profiles"), config.get("record_types"))
+
+
+FIELD_MAPPING = load_field_mapping(os.environ.get("FIELD_MAPPING_FILE"))
+
+
+class DiamondEntry(namedtuple("DiamondEntry", "name state decode wrapped")):
+    """How to decode one tag inside a constructed type.
+
+    ``decode`` is set for primitive fields. Otherwise ``state`` names the
+    constructed type of the value; ``wrapped`` marks an explicit tag around
+    a CHOICE, whose single inner element selects the alternative.
+    """
+
+    __slots__ = ()
+
+
+class DiamondSpec:
+    """Tag-dispatch decoder compiled from a Diamond decoder XML.
+
+    ``table`` maps ``(state, tag_class, tag_number)`` to a
+    :class:`DiamondEntry`, where ``state`` is the constructed type being
+    decoded, so decoding a record is one dict lookup per element. ``decode``
+    mirrors the ``asn1tools`` API so the spec can stand in for a compiled
+    ASN.1 module.
+    """
+
+    def __init__(self, name, root_type=None, record_type=None):
+        self.name = name
+        self.root_type = root_type
+        self.record_type = record_type
+        self.table = {}
+        # state -> "sequence", "set", "choice", "sequence_of" or "set_of"
+        self.kinds = {}
+        # field path (``mtCallRecord.servedIMSI``) -> mapping targets
+        self.mappings = {}
+
+    def decode(self, type_name, data, check_constraints=False):
+        """Decode the single element in ``data`` as ``type_name``."""
+        tlv = read_tlv(data, 0)
+        if tlv is None:
+            raise ValueError(f"Incomplete {type_name} element")
+        if self.kinds.get(type_name) == "choice":
+            return self._decode_choice(type_name, data, tlv)
+        return self._decode_contents(type_name, data, tlv.value_offset, tlv.value_end)
+
+    def _decode_contents(self, state, data, offset, end):
+        table = self.table
+        repeated = self.kinds[state] in ("sequence_of", "set_of")
+        result = [] if repeated else {}
+        pos = offset
+        while pos < end:
+            tlv = read_tlv(data, pos, end)
+            if tlv is None:
+                raise ValueError(f"Truncated element at offset {pos}")
+            pos = tlv.end
+            entry = table.get((state, tlv.tag_class, tlv.tag_number))
+            if entry is None:
+                name = (
+                    f"[{tlv.tag_number}]"
+                    if tlv.tag_class == TAG_CLASS_CONTEXT
+                    else f"[{TAG_CLASS_NAMES[tlv.tag_class]} {tlv.tag_number}]"
+                )
+                value = self._decode_unknown(data, tlv)
+            else:
+                name = entry.name
+                value = self._decode_entry(entry, data, tlv)
+
+            if repeated:
+                result.append(value if name is None else {name: value})
+            elif name not in result:
+                result[name] = value
+            elif isinstance(result[name], list):
+                result[name].append(value)
+            else:
+                result[name] = [result[name], value]
+        return result
+
+    def _decode_entry(self, entry, data, tlv):
+        if entry.decode is not None:
+            if tlv.constructed:
+                return self._decode_unknown(data, tlv)
+            return entry.decode(data[tlv.value_offset : tlv.value_end])
+        if entry.wrapped:
+            inner = read_tlv(data, tlv.value_offset, tlv.value_end)
+            if inner is None:
+                return None
+            return self._decode_choice(entry.state, data, inner)
+        if self.kinds[entry.state] == "choice":
+            return self._decode_choice(entry.state, data, tlv)
+        if not tlv.constructed:
+            return decode_octets(data[tlv.value_offset : tlv.value_end])
+        return self._decode_contents(entry.state, data, tlv.value_offset, tlv.value_end)
+
+    def _decode_choice(self, state, data, tlv):
+        entry = self.table.get((state, tlv.tag_class, tlv.tag_number))
+        if entry is None:
+            return {f"[{tlv.tag_number}]": self._decode_unknown(data, tlv)}
+        return {entry.name: self._decode_entry(entry, data, tlv)}
+
+    def _decode_unknown(self, data, tlv):
+        if not tlv.constructed:
+            return decode_octets(data[tlv.value_offset : tlv.value_end])
+        result = {}
+        pos = tlv.value_offset
+        while pos < tlv.value_end:
+            child = read_tlv(data, pos, tlv.value_end)
+            if child is None:
+                break
+            result[f"[{child.tag_number}]"] = self._decode_unknown(data, child)
+            pos = child.end
+        return result
+
+
+class _DiamondCompiler:
+    """Build a :class:`DiamondSpec` from the ``<Decoder>`` element."""
+
+    def __init__(self, decoder):
+        self.types = {rt.get("name"): rt for rt in decoder.findall("RecordType")}
+        self.spec = DiamondSpec(decoder.get("name"))
+        # type name -> (decode, state, natural tag)
+        self.resolved = {}
+        # state -> item state of SEQUENCE OF / SET OF types
+        self.items = {}
+        self.untagged_choices = []
+
+    def compile(self):
+        spec = self.spec
+        for name, record_type in self.types.items():
+            if record_type.get("root") == "true":
+                spec.root_type = name
+            self.resolve_type(name)
+
+        # Untagged CHOICE fields are keyed by their alternatives' tags, which
+        # are only complete once every type is compiled
+        for state, name, choice in self.untagged_choices:
+            for (owner, tag_class, tag_number), alternative in list(spec.table.items()):
+                if owner == choice:
+                    key = (state, tag_class, tag_number)
+                    spec.table.setdefault(key, DiamondEntry(name, choice, None, False))
+
+        # Records are the items of the root's SEQUENCE OF (callEventRecords)
+        for (owner, _, _), entry in spec.table.items():
+            if owner == spec.root_type and entry.state in self.items:
+                spec.record_type = self.items[entry.state]
+                break
+        return spec
+
+    def resolve_type(self, name):
+        if name in self.resolved:
+            return self.resolved[name]
+        record_type = self.types.get(name)
+        if record_type is None:
+            raise ValueError(f"Unknown Diamond record type {name!r}")
+        body, *extra = list(record_type)
+        if body.tag == "Logic" and body.get("type") in DIAMOND_CONSTRUCTED:
+            # Reserve the state first so recursive references terminate
+            self.spec.kinds[name] = DIAMOND_CONSTRUCTED[body.get("type")]
+            self.resolved[name] = (None, name, DIAMOND_NATURAL_TAGS.get(body.get("type")))
+        self.resolved[name] = self.resolve_body(body, name, extra)
+        return self.resolved[name]
+
+    def resolve_body(self, body, state, extra=()):
+        """Return ``(decode, state, natural_tag)`` for a type body element."""
+        if body.tag == "ASN1Field":
+            field_type = body.get("type")
+            return self.primitive_decoder(body), None, DIAMOND_NATURAL_TAGS.get(field_type)
+
+        body_type = body.get("type")
+        if body_type == "recordReference":
+            return self.resolve_type(body.get("recordType"))
+        if body_type == "ASN1Record":
+            # Named wrapper such as ``dummy`` around a single reference
+            return self.resolve_body(self.field_body(body), state)
+
+        kind = DIAMOND_CONSTRUCTED.get(body_type)
+        if kind is None:
+            raise ValueError(f"Unsupported Diamond logic {body_type!r} in {state}")
+        self.spec.kinds[state] = kind
+        if kind in ("sequence_of", "set_of"):
+            item_state = self.add_field(state, None, None, next(iter(body)))
+            if item_state:
+                self.items[state] = item_state
+        else:
+            for field in list(body) + list(extra):
+                if field.tag == "Logic" and field.get("type") == "ASN1Record":
+                    self.add_field(
+                        state, field.get("name"), field.find("Identifier"),
+                        self.field_body(field),
+                    )
+        return None, state, DIAMOND_NATURAL_TAGS.get(body_type)
+
+    def add_field(self, state, name, identifier, body):
+        """Register the tag(s) of one field of ``state``; returns its state."""
+        path = f"{state}.{name}" if name else f"{state}.item"
+        decode, target, natural_tag = self.resolve_body(body, path)
+        is_choice = target is not None and self.spec.kinds.get(target) == "choice"
+
+        if identifier is not None:
+            tag_class = DIAMOND_TAG_CLASSES[identifier.get("tagClass", "context")]
+            tag_number = int(identifier.get("idValue"))
+            # CHOICE types cannot be implicitly tagged, so the tag wraps the alternative
+            key = (state, tag_class, tag_number)
+            self.spec.table[key] = DiamondEntry(name, target, decode, is_choice)
+        elif is_choice:
+            self.untagged_choices.append((state, name, target))
+        elif natural_tag is not None:
+            key = (state, TAG_CLASS_UNIVERSAL, natural_tag)
+            self.spec.table[key] = DiamondEntry(name, target, decode, False)
+        return target
+
+    @staticmethod
+    def field_body(field):
+        for child in field:
+            if child.tag != "Identifier":
+                return child
+        raise ValueError(f"Diamond field {field.get('name')!r} has no type")
+
+    @staticmethod
+    def primitive_decoder(field):
+        field_type = field.get("type")
+        if field_type == "integer":
+            return decode_integer
+        if field_type == "null":
+            return decode_null
+        if field_type == "boolean":
+            return decode_boolean
+        if field_type == "ia5string":
+            return partial(decode_text, encoding="ascii")
+        if field.get("nibbleSwap") == "true":
+            return partial(decode_tbcd, stop_at_filler=field.get("termChar") == "F")
+        if field.get("encoding") and field.get("trimWhiteSpace") == "true":
+            return partial(decode_text, encoding=field.get("encoding"), strip=True)
+        return decode_octets
+
+
+def compile_diamond_xml(root):
+    """Compile a parsed ``<Diamond>`` document into a :class:`DiamondSpec`."""
+    decoder = root.find("Decoder")
+    if decoder is None:
+        raise ValueError("Diamond XML has no <Decoder> section")
+    spec = _DiamondCompiler(decoder).compile()
+
+    for mapping in root.iter("Mapping"):
+        match = DIAMOND_FIELD_MAPPING.match(mapping.get("expression", "").strip())
+        if match and mapping.get("target"):
+            spec.mappings.setdefault(match.group(1), []).append(mapping.get("target"))
+    return spec
+
+
+class SpecCache:
+    """Process-wide LRU cache of compiled ASN.1 specifications.
+
+    Entries are keyed by the SHA-256 of the spec file, the codec and the kind
+    of source (``"asn1"`` or ``"xml"``), so re-uploads of the same spec under
+    another name share one compilation. The digest of each path is kept with
+    the file's mtime and size and only recomputed when either changes. When ``cache_dir`` is set, compiled
+    specs are also pickled there so freshly started workers can skip
+    compilation. The directory must only be writable by the application.
+    """
+
+    def __init__(self, max_size=8, cache_dir=None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.logger = logging.getLogger(__name__)
+        self._entries = OrderedDict()
+        # spec path -> (mtime_ns, size, digest)
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def get(self, spec_path, codec, kind, compile_spec):
+        """Return the compiled spec for ``spec_path``, compiling on a miss.
+
+        ``compile_spec`` is called without arguments and must return the value
+        to cache.
+        """
+        key = (self._digest(spec_path), codec, kind)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        value = self._load(key)
+        if value is None:
+            value = compile_spec()
+            self._store(key, value)
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Drop every in-memory entry."""
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+
+    def _digest(self, spec_path):
+        stat = os.stat(spec_path)
+        with self._lock:
+            known = self._digests.get(spec_path)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known[2]
+        with open(spec_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            self._digests[spec_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def _disk_path(self, key):
+        digest, codec, kind = key
+        version = getattr(asn1tools, "__version__", "unknown")
+        return os.path.join(
+            self.cache_dir, f"{digest}-{codec}-{kind}-{version}.pickle"
+        )
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:  # pragma: no cover - corrupt cache entry
+            self.logger.warning(f"Ignoring unreadable spec cache entry: {exc}")
+            return None
+
+    def _store(self, key, value):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as exc:  # pragma: no cover - best effort
+            self.logger.warning(f"Could not write spec cache entry {path}: {exc}")
+
+
+spec_cache = SpecCache(
+    max_size=int(os.environ.get("SPEC_CACHE_SIZE", "8")),
+    cache_dir=os.environ.get("SPEC_CACHE_DIR"),
+)
+
+
+# Parser of the current pool worker, created once by _init_shard_worker
+_shard_parser = None
+
+
+def _init_shard_worker(spec_path, top_type):
+    global _shard_parser
+    _shard_parser = CDRParser(spec_path=spec_path, top_type=top_type)
+
+
+def _parse_shard(filepath, offset, start_record, max_records):
+    """Decode one shard in a pool worker.
+
+    Returns its records and the metrics collected while decoding them.
+    Records that fail to decode come back as fallback records, so a shard
+    only ends before its planned number of records when the record headers
+    planned by :meth:`CDRParser.plan_shards` can no longer be walked, e.g.
+    because the file changed. That is raised, since the shards after it are
+    already numbered. This module must not import ``app``: workers are
+    spawned and only import what the shard needs.
+    """
+    records = list(
+        islice(_shard_parser.iter_records(filepath, offset, start_record), max_records)
+    )
+    if max_records is not None and len(records) < max_records:
+        raise ValueError(
+            f"Shard at offset {offset} of {filepath} decoded {len(records)} "
+            f"of {max_records} records"
+        )
+    return records, metrics.REGISTRY.drain()
+
+
 class CDRParser:
     """SENORA ASN parser for telecom Call Detail Records"""
 
@@ -25,24 +1263,48 @@ class CDRParser:
         """Create a parser optionally using an ASN.1 specification."""
 
         self.logger = logging.getLogger(__name__)
+        self.spec_path = spec_path
         self.spec = None
+        # Header/trailer of a CallEventDataFile container, once detected
+        self.file_metadata = None
         self.top_type = top_type
-        if spec_path and asn1tools:
+        self.field_mapping = FIELD_MAPPING
+        # TimeStamp cache, cleared for every file
+        self.timestamps = TimestampDecoder()
+        self.field_decoders = field_decoders(self.timestamps)
+        if spec_path:
             try:
                 if spec_path.lower().endswith(".xml") and ET is not None:
-                    self.spec, self.top_type = self._load_xml_spec(spec_path)
-                else:
-                    self.spec = asn1tools.compile_files(spec_path, "ber")
+                    self.spec, self.top_type = spec_cache.get(
+                        spec_path, "ber", "xml", lambda: self._load_xml_spec(spec_path)
+                    )
+                elif asn1tools:
+                    self.spec = spec_cache.get(
+                        spec_path,
+                        "ber",
+                        "asn1",
+                        lambda: asn1tools.compile_files(spec_path, "ber"),
+                    )
             except Exception as exc:  # pragma: no cover - best effort
                 self.logger.error(f"Failed to load ASN.1 spec {spec_path}: {exc}")
 
     def _load_xml_spec(self, xml_path):
-        """Convert a simple decoder XML to an ASN.1 spec."""
+        """Compile a decoder XML into a spec and the type of one record.
+
+        Diamond decoder descriptions become a :class:`DiamondSpec`; simple
+        ``<field name=...>`` lists are converted to an ASN.1 ``Record``.
+        """
         if ET is None:
             raise RuntimeError("XML support not available")
         try:
             tree = ET.parse(xml_path)
             root = tree.getroot()
+            if root.tag == "Diamond":
+                spec = compile_diamond_xml(root)
+                return spec, spec.record_type
+
+            if asn1tools is None:
+                raise RuntimeError("asn1tools is required for simple decoder XML")
             fields = [f.get("name") for f in root.findall(".//field") if f.get("name")]
             if not fields:
                 raise ValueError("No field names found in decoder XML")
@@ -61,9 +1323,6 @@ class CDRParser:
         except Exception as exc:  # pragma: no cover - best effort
             self.logger.error(f"Failed to load XML spec {xml_path}: {exc}")
             raise
-                self.spec = asn1tools.compile_files(spec_path, "ber")
-            except Exception as exc:  # pragma: no cover - best effort
-                self.logger.error(f"Failed to load ASN.1 spec {spec_path}: {exc}")
 
     def parse_timestamp_from_filename(self, filename):
         """Extract a timestamp from a filename if present.
@@ -83,8 +1342,10 @@ class CDRParser:
     def parse_file(self, filepath):
         """Parse a CDR file and return a list of records"""
         try:
-            if self.spec and self.top_type:
-                return self.parse_file_with_spec(filepath)
+            # Spec-decoded files and CallEventDataFile containers are split
+            # into record-aligned shards decoded on all cores
+            if (self.spec and self.top_type) or self.read_container_layout(filepath):
+                return self.parse_file_parallel(filepath)
 
             # Check file size first
             file_size = os.path.getsize(filepath)
@@ -112,100 +1373,219 @@ class CDRParser:
                 return self.parse_raw_binary_file(filepath)
             except Exception:
                 raise Exception(f"Failed to read file: {str(e)}")
-    def parse_file_with_spec(self, filepath, offset=0, max_records=None):
-        """Parse using a compiled ASN.1 specification.
 
-        Parameters
-        ----------
-        filepath: str
-            Path to the file to parse.
-        offset: int, optional
-            Byte offset to start reading from.
-        max_records: int, optional
-            Maximum number of records to decode.
-        """
-        records: list[dict] = []
-        if not (self.spec and self.top_type):
-            return self.parse_file(filepath)
-
-        try:
-            with open(filepath, "rb") as f:
-                f.seek(offset)
-                data = f.read()
+    def iter_records(self, filepath, offset=0, start_record=0):
+        """Yield parsed records one at a time, starting at byte ``offset``.
 
-            consumed = 0
-            while consumed < len(data):
-                try:
-                    decoded, rest = self.spec.decode(
-                        self.top_type,
-                        data[consumed:],
-                        check_constraints=False,
-                    )
-                    records.append(self.asn1_to_dict(decoded))
-                    consumed = len(data) - len(rest)
-                    if max_records and len(records) >= max_records:
-                        break
-                except Exception as exc:
-                    self.logger.debug(f"Spec decode error at {offset + consumed}: {exc}")
-                    break
-        except Exception as exc:
-            self.logger.error(f"Failed to parse with spec: {exc}")
-
-        new_offset = offset + consumed
-        reached_end = consumed >= len(data)
-        return records, reached_end, new_offset
-
-    def parse_file_chunk(self, filepath, start_record=0, max_records=100, offset=0):
-        """Parse part of a file starting from ``offset`` and ``start_record``.
-
-        Returns ``(records, reached_end, new_offset)``.
+        The file is memory-mapped and walked in place, so only the record being
+        decoded is touched and there is no limit on the number of records.
+        Every record carries ``record_offset`` and ``record_length`` (absolute
+        file positions), so a consumer can resume from
+        ``record_offset + record_length``. A record whose contents cannot be
+        decoded is replaced by a raw binary analysis of its bytes and the walk
+        goes on; only bytes that are not a BER element end it.
         """
         if self.spec and self.top_type:
-            return self.parse_file_with_spec(
-                filepath,
-                offset=offset,
-                max_records=max_records,
+            yield from self._iter_spec_records(filepath, offset, start_record)
+            return
+
+        layout = self.read_container_layout(filepath)
+        record_index = start_record
+        pos = max(offset, layout["records_offset"]) if layout else offset
+        self.timestamps.clear()
+        with self.map_file(filepath) as view:
+            try:
+                for tlv in self._iter_record_tlvs(view, offset, layout):
+                    self._count_record(tlv, pos)
+                    try:
+                        record = self._decode_record(
+                            view[tlv.offset : tlv.end], record_index, tlv.offset
+                        )
+                    except ValueError as e:
+                        record = self._undecodable_record(
+                            "ber", view[tlv.offset : tlv.end], record_index, tlv.offset, e
+                        )
+                    yield record
+                    record_index += 1
+                    pos = tlv.end
+            except ValueError as e:
+                # Trailing bytes that are not a BER element
+                metrics.record_decode_failure("ber", pos, len(view) - pos)
+                self.logger.info(
+                    f"ASN.1 decoding failed at offset {pos} ({e}), "
+                    "attempting raw binary analysis"
+                )
+                chunk = bytes(view[pos : pos + 10 * 1024 * 1024])
+                if chunk:
+                    record = self.analyze_binary_chunk(chunk, record_index)
+                    record["record_offset"] = pos
+                    record["record_length"] = len(chunk)
+                    yield record
+
+    def iter_records_parallel(
+        self, filepath, workers=None, shard_bytes=None, offset=0, start_record=0
+    ):
+        """Yield records from byte ``offset`` on, decoding shards in worker processes.
+
+        Shards are runs of whole records planned by :meth:`plan_shards`, so
+        each worker decodes independently and numbers its records from the
+        shard's global ``start_record``. Records are yielded in file order and
+        at most ``2 * workers`` shards are in flight at a time.
+        """
+        workers = workers or PARSE_WORKERS
+        shards = self.plan_shards(filepath, shard_bytes, offset, start_record)
+        if workers < 2 or len(shards) < 2:
+            yield from self.iter_records(filepath, offset, start_record)
+            return
+
+        self.logger.info(f"Parsing {filepath} in {len(shards)} shards on {workers} workers")
+        # Spawned rather than forked: ingest runs on a thread of a threaded
+        # server, and a forked child could inherit locks held by other threads
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_shard_worker,
+            initargs=(self.spec_path, self.top_type),
+        ) as executor:
+            submitted = (
+                executor.submit(_parse_shard, filepath, *shard) for shard in shards
             )
-        records = []
-        chunk_size = 10 * 1024 * 1024  # 10MB
+            pending = deque(islice(submitted, 2 * workers))
+            while pending:
+                records, samples = pending.popleft().result()
+                metrics.REGISTRY.merge(samples)
+                pending.extend(islice(submitted, 1))
+                yield from records
+
+    def parse_file_parallel(self, filepath, workers=None, shard_bytes=None):
+        """Parse ``filepath`` on several cores; see :meth:`iter_records_parallel`."""
+        return list(self.iter_records_parallel(filepath, workers, shard_bytes))
+
+    def plan_shards(self, filepath, shard_bytes=None, offset=0, start_record=0):
+        """Split the records of ``filepath`` into shards of roughly ``shard_bytes``.
+
+        Only record headers from byte ``offset`` on are walked, numbering them
+        from ``start_record``. Returns a list of ``(offset,
+        start_record, count)``; the last shard has ``count`` ``None`` when
+        trailing bytes could not be walked, so it runs on to the end of the
+        file like :meth:`iter_records`.
+        """
+        shard_bytes = shard_bytes or PARSE_SHARD_BYTES
+        shards = []
+        shard_offset = None
+        shard_start = count = 0
         record_index = start_record
-        reached_end = False
-        new_offset = offset
-
         try:
-            with open(filepath, "rb") as f:
-                f.seek(offset)
-                while len(records) < max_records:
-                    chunk_start = f.tell()
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        reached_end = True
-                        break
+            for tlv in self.iter_record_boundaries(filepath, offset):
+                if shard_offset is None:
+                    shard_offset, shard_start, count = tlv.offset, record_index, 0
+                count += 1
+                record_index += 1
+                if tlv.end - shard_offset >= shard_bytes:
+                    shards.append((shard_offset, shard_start, count))
+                    shard_offset = None
+        except ValueError as e:
+            self.logger.debug(f"Record walk of {filepath} stopped early: {e}")
+            if shard_offset is None and shards:
+                shard_offset, shard_start, _ = shards.pop()
+            elif shard_offset is None:
+                shard_offset, shard_start = offset, start_record
+            count = None
+        if shard_offset is not None:
+            shards.append((shard_offset, shard_start, count))
+        return shards
+
+    def _iter_spec_records(self, filepath, offset=0, start_record=0):
+        """Yield records decoded with the compiled ASN.1 specification.
+
+        Each record is decoded from a memoryview bounded by its own end offset,
+        so the cost is linear in the bytes decoded. A record the specification
+        cannot decode is replaced by a raw binary analysis of its bytes and
+        the walk goes on; only bytes that are not a BER element end it.
+        """
+        layout = self.read_container_layout(filepath)
+        record_index = start_record
+        pos = max(offset, layout["records_offset"]) if layout else offset
+        self.timestamps.clear()
+        with self.map_file(filepath) as view:
+            try:
+                for tlv in self._iter_record_tlvs(view, offset, layout):
+                    self._count_record(tlv, pos)
+                    try:
+                        record = self._decode_spec_record(
+                            view[tlv.offset : tlv.end], record_index, tlv.offset
+                        )
+                    except Exception as e:
+                        record = self._undecodable_record(
+                            "spec", view[tlv.offset : tlv.end], record_index, tlv.offset, e
+                        )
+                    yield record
+                    record_index += 1
+                    pos = tlv.end
+            except ValueError as e:
+                # Trailing bytes that are not a BER element
+                metrics.record_decode_failure("spec", pos, len(view) - pos)
+                self.logger.warning(
+                    f"Record walk of {filepath} stopped at offset {pos}: {e}"
+                )
 
-                    if len(chunk) == chunk_size:
-                        boundary_search = chunk[-1024:]
-                        boundary_pos = -1
-                        for i in range(len(boundary_search) - 1, 0, -1):
-                            if boundary_search[i] in [0x30, 0x31, 0x02, 0x04]:
-                                boundary_pos = len(chunk) - len(boundary_search) + i
-                                break
-                        if boundary_pos > 0:
-                            process_chunk = chunk[:boundary_pos]
-                            f.seek(chunk_start + boundary_pos)
-                            chunk = process_chunk
-                    chunk_records = self.parse_binary_data_chunk(chunk, record_index)
-                    records.extend(chunk_records)
-                    record_index += len(chunk_records)
-                    new_offset = f.tell()
-                    if len(records) >= max_records:
-                        break
+    def _undecodable_record(self, decoder, data, record_index, offset, error):
+        """Fallback record for one record element ``decoder`` could not decode."""
+        metrics.record_decode_failure(decoder, offset)
+        self.logger.warning(
+            f"Record {record_index} at offset {offset} could not be decoded "
+            f"({error}), using raw binary analysis"
+        )
+        record = self.analyze_binary_chunk(bytes(data), record_index)
+        record["decode_error"] = str(error)
+        record["record_offset"] = offset
+        record["record_length"] = len(data)
+        return record
 
-        except Exception as e:
-            self.logger.error(f"Error processing file chunk: {str(e)}")
+    def _count_record(self, tlv, previous_end):
+        """Count a record about to be decoded and the filler before it."""
+        metrics.RECORDS_PARSED.inc()
+        metrics.BYTES_PARSED.inc(tlv.end - tlv.offset)
+        if tlv.offset > previous_end:
+            metrics.BYTES_SKIPPED.inc(tlv.offset - previous_end, "filler")
+
+    def _decode_spec_record(self, data, record_index, offset):
+        """Decode one record with the compiled specification."""
+        with metrics.timer("decode"):
+            decoded = self.spec.decode(self.top_type, data, check_constraints=False)
+        if isinstance(self.spec, DiamondSpec):
+            record = self._process_diamond_record(decoded, record_index, data)
+        else:
+            with metrics.timer("asn1_to_dict"):
+                record = self.asn1_to_dict(decoded)
+        record["record_index"] = record_index
+        record["record_offset"] = offset
+        record["record_length"] = len(data)
+        record["whole_element"] = True
+        return record
 
-        return records, reached_end, new_offset
+    def _process_diamond_record(self, decoded, record_index, data=None):
+        """Turn a ``{alternative: fields}`` CHOICE value into a record."""
+        record = self.process_asn1_object(decoded, record_index, data)
+        if len(decoded) == 1:
+            record["record_type"] = next(iter(decoded))
+        return record
+
+    @contextmanager
+    def map_file(self, filepath):
+        """Memory-map ``filepath`` read-only and yield a ``memoryview`` of it."""
+        with open(filepath, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield memoryview(b"")
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
 
-    def parse_file_with_spec(self, filepath, offset=0, max_records=None):
+    def parse_file_with_spec(self, filepath, offset=0, max_records=None, start_record=0):
         """Parse using a compiled ASN.1 specification.
 
         Parameters
@@ -216,237 +1596,337 @@ class CDRParser:
             Byte offset to start reading from.
         max_records: int, optional
             Maximum number of records to decode.
+        start_record: int, optional
+            ``record_index`` of the first decoded record.
+
+        Returns ``(records, reached_end, new_offset)`` like
+        :meth:`parse_file_chunk`. Without a loaded specification the records
+        are decoded by the built-in tag mapping.
         """
-        records: list[dict] = []
-        if not (self.spec and self.top_type):
-            return self.parse_file(filepath)
+        return self._collect_records(filepath, offset, start_record, max_records)
 
-        try:
-            with open(filepath, "rb") as f:
-                f.seek(offset)
-                data = f.read()
+    def parse_file_chunk(self, filepath, start_record=0, max_records=1000, offset=0):
+        """Parse part of a file starting from ``offset`` and ``start_record``.
 
-            consumed = 0
-            while consumed < len(data):
-                try:
-                    decoded, rest = self.spec.decode(
-                        self.top_type,
-                        data[consumed:],
-                        check_constraints=False,
-                    )
-                    records.append(self.asn1_to_dict(decoded))
-                    consumed = len(data) - len(rest)
-                    if max_records and len(records) >= max_records:
-                        break
-                except Exception as exc:
-                    self.logger.debug(f"Spec decode error at {offset + consumed}: {exc}")
-                    break
-        except Exception as exc:
-            self.logger.error(f"Failed to parse with spec: {exc}")
+        Returns ``(records, reached_end, new_offset)``.
+        """
+        if start_record and not offset:
+            # Seek straight to the requested record when the file is indexed
+            index = self.get_record_index(filepath)
+            if index is not None and start_record < len(index):
+                offset = index.entry(start_record).offset
 
-        new_offset = offset + consumed
-        reached_end = consumed >= len(data)
-        return records, reached_end, new_offset
+        return self._collect_records(filepath, offset, start_record, max_records)
 
-    def parse_file_chunk(self, filepath, start_record=0, max_records=100, offset=0):
-        """Parse part of a file starting from ``offset`` and ``start_record``.
+    def _collect_records(self, filepath, offset, start_record, max_records):
+        """Gather up to ``max_records`` from :meth:`iter_records`.
 
         Returns ``(records, reached_end, new_offset)``.
         """
-        if self.spec and self.top_type:
-            return self.parse_file_with_spec(
-                filepath,
-                offset=offset,
-                max_records=max_records,
-            )
-
         records = []
-        chunk_size = 10 * 1024 * 1024  # 10MB
-        record_index = start_record
-        reached_end = False
+        reached_end = True
         new_offset = offset
 
         try:
-            with open(filepath, "rb") as f:
-                f.seek(offset)
-                while len(records) < max_records:
-                    chunk_start = f.tell()
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        reached_end = True
-                        break
-
-                    if len(chunk) == chunk_size:
-                        boundary_search = chunk[-1024:]
-                        boundary_pos = -1
-                        for i in range(len(boundary_search) - 1, 0, -1):
-                            if boundary_search[i] in [0x30, 0x31, 0x02, 0x04]:
-                                boundary_pos = len(chunk) - len(boundary_search) + i
-                                break
-                        if boundary_pos > 0:
-                            process_chunk = chunk[:boundary_pos]
-                            f.seek(chunk_start + boundary_pos)
-                            chunk = process_chunk
-
-                    chunk_records = self.parse_binary_data_chunk(chunk, record_index)
-                    records.extend(chunk_records)
-                    record_index += len(chunk_records)
-                    new_offset = f.tell()
-                    if len(records) >= max_records:
-                        break
-
+            for record in self.iter_records(filepath, offset, start_record):
+                records.append(record)
+                new_offset = record["record_offset"] + record["record_length"]
+                if max_records and len(records) >= max_records:
+                    reached_end = False
+                    break
         except Exception as e:
             self.logger.error(f"Error processing file chunk: {str(e)}")
 
         return records, reached_end, new_offset
 
-    def parse_file_with_spec(self, filepath, offset=0, max_records=None):
-        """Parse using a compiled ASN.1 specification.
+    def read_container_layout(self, filepath):
+        """Locate the sections of a CallEventDataFile container.
 
-        Parameters
-        ----------
-        filepath: str
-            Path to the file to parse.
-        offset: int, optional
-            Byte offset to start reading from.
-        max_records: int, optional
-            Maximum number of records to decode.
+        Only tag and length headers are read. Returns ``None`` when the file is
+        not a container, otherwise a dict with the byte range of
+        ``callEventRecords`` and the decoded header and trailer. The header and
+        trailer are also stored on ``self.file_metadata``.
         """
-        records: list[dict] = []
-        if not (self.spec and self.top_type):
-            return self.parse_file(filepath)
-
         try:
             with open(filepath, "rb") as f:
-                f.seek(offset)
-                data = f.read()
-
-            consumed = 0
-            while consumed < len(data):
-                try:
-                    decoded, rest = self.spec.decode(
-                        self.top_type,
-                        data[consumed:],
-                        check_constraints=False,
-                    )
-                    records.append(self.asn1_to_dict(decoded))
-                    consumed = len(data) - len(rest)
-                    if max_records and len(records) >= max_records:
-                        break
-                except Exception as exc:
-                    self.logger.debug(f"Spec decode error at {offset + consumed}: {exc}")
-                    break
-        except Exception as exc:
-            self.logger.error(f"Failed to parse with spec: {exc}")
+                outer = self._read_file_tlv_header(f, 0)
+                if (
+                    outer is None
+                    or outer.tag_class != TAG_CLASS_UNIVERSAL
+                    or outer.tag_number != 16
+                    or not outer.constructed
+                    or outer.indefinite
+                ):
+                    return None
+
+                sections = {}
+                pos = outer.value_offset
+                while pos < outer.value_end:
+                    tlv = self._read_file_tlv_header(f, pos)
+                    if tlv is None or tlv.tag_class != TAG_CLASS_CONTEXT or tlv.indefinite:
+                        return None
+                    sections[tlv.tag_number] = tlv
+                    pos = tlv.end
+
+                records = sections.get(CONTAINER_RECORDS_TAG)
+                if records is None or CONTAINER_HEADER_TAG not in sections:
+                    return None
+
+                metadata = {"container": "CallEventDataFile"}
+                for tag, name, fields in (
+                    (CONTAINER_HEADER_TAG, "header", HEADER_RECORD_FIELDS),
+                    (CONTAINER_TRAILER_TAG, "trailer", TRAILER_RECORD_FIELDS),
+                ):
+                    tlv = sections.get(tag)
+                    if tlv is not None:
+                        f.seek(tlv.value_offset)
+                        metadata[name] = self._decode_container_section(
+                            f.read(tlv.length), fields
+                        )
+        except (OSError, ValueError) as e:
+            self.logger.debug(f"Not a CallEventDataFile container: {e}")
+            return None
 
-        new_offset = offset + consumed
-        reached_end = consumed >= len(data)
-        return records, reached_end, new_offset
+        self.file_metadata = metadata
+        return {
+            "records_offset": records.value_offset,
+            "records_end": records.value_end,
+            "file_end": outer.end,
+            "sections": {tag: (tlv.offset, tlv.end) for tag, tlv in sections.items()},
+            "metadata": metadata,
+        }
 
-    def parse_file_chunk(self, filepath, start_record=0, max_records=1000, offset=0):
-        """Parse part of a file starting from ``offset`` and ``start_record``.
+    def splice_records(self, filepath, dest_path, records):
+        """Write a file holding only the given records of ``filepath``.
 
-        Returns ``(records, reached_end, new_offset)``.
+        ``records`` lists the ``(offset, length)`` of each record in output
+        order. Runs of adjacent records are copied with
+        :func:`splice_file_range` without passing through Python. A
+        CallEventDataFile container is rebuilt around them: the header and
+        extensions are copied, the ``callEventRecords`` and outer lengths are
+        recomputed and the trailer's ``noOfRecords`` is set to the number of
+        records written. Returns the offset of each record in the new file.
         """
-        if self.spec and self.top_type:
-            return self.parse_file_with_spec(
-                filepath,
-                offset=offset,
-                max_records=max_records,
-            )
-
-        records = []
-        chunk_size = 10 * 1024 * 1024  # 10MB
-        record_index = start_record
-        reached_end = False
-        new_offset = offset
+        runs = []
+        for offset, length in records:
+            if runs and runs[-1][0] + runs[-1][1] == offset:
+                runs[-1][1] += length
+            else:
+                runs.append([offset, length])
+        records_size = sum(length for _, length in runs)
 
+        layout = self.read_container_layout(filepath)
+        src_fd = os.open(filepath, os.O_RDONLY)
         try:
-            with open(filepath, "rb") as f:
-                f.seek(offset)
-                while len(records) < max_records:
-                    chunk_start = f.tell()
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        reached_end = True
-                        break
+            prefix, suffix = [], []
+            if layout is not None:
+                parts = prefix
+                for tag, (start, end) in layout["sections"].items():
+                    if tag == CONTAINER_RECORDS_TAG:
+                        parts.append(
+                            encode_tlv_header(
+                                TAG_CLASS_CONTEXT, True, CONTAINER_RECORDS_TAG, records_size
+                            )
+                        )
+                        parts = suffix
+                        continue
+                    section = os.pread(src_fd, end - start, start)
+                    if tag == CONTAINER_TRAILER_TAG:
+                        section = self._recount_trailer(section, len(records))
+                    parts.append(section)
+                body_size = records_size + sum(map(len, prefix + suffix))
+                prefix.insert(
+                    0, encode_tlv_header(TAG_CLASS_UNIVERSAL, True, 16, body_size)
+                )
 
-                    if len(chunk) == chunk_size:
-                        boundary_search = chunk[-1024:]
-                        boundary_pos = -1
-                        for i in range(len(boundary_search) - 1, 0, -1):
-                            if boundary_search[i] in [0x30, 0x31, 0x02, 0x04]:
-                                boundary_pos = len(chunk) - len(boundary_search) + i
-                                break
-                        if boundary_pos > 0:
-                            process_chunk = chunk[:boundary_pos]
-                            f.seek(chunk_start + boundary_pos)
-                            chunk = process_chunk
-
-                    chunk_records = self.parse_binary_data_chunk(chunk, record_index)
-                    records.extend(chunk_records)
-                    record_index += len(chunk_records)
-                    new_offset = f.tell()
-                    if len(records) >= max_records:
-                        break
+            dst_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                os.write(dst_fd, b"".join(prefix))
+                for offset, length in runs:
+                    splice_file_range(src_fd, dst_fd, offset, length)
+                os.write(dst_fd, b"".join(suffix))
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+        new_offsets = []
+        position = sum(map(len, prefix))
+        for _, length in records:
+            new_offsets.append(position)
+            position += length
+        return new_offsets
+
+    def _recount_trailer(self, section, count):
+        """Return a trailer TLV with ``noOfRecords`` replaced by ``count``."""
+        trailer = self.read_tlv(section, 0)
+        value = []
+        for tlv in self.iter_tlv(section, trailer.value_offset, trailer.value_end):
+            if tlv.tag_number == TRAILER_COUNT_TAG and not tlv.constructed:
+                number = count.to_bytes(count.bit_length() // 8 + 1, "big")
+                value.append(
+                    encode_tlv_header(tlv.tag_class, False, tlv.tag_number, len(number))
+                    + number
+                )
+            else:
+                value.append(section[tlv.offset : tlv.end])
+        value = b"".join(value)
+        return (
+            encode_tlv_header(
+                trailer.tag_class, trailer.constructed, trailer.tag_number, len(value)
+            )
+            + value
+        )
 
-        except Exception as e:
-            self.logger.error(f"Error processing file chunk: {str(e)}")
+    def _read_file_tlv_header(self, f, pos):
+        """Read the :class:`TLV` header at ``pos`` of an open file.
 
-        return records, reached_end, new_offset
+        Indefinite lengths are resolved by reading progressively larger windows.
+        Returns ``None`` at end of file or when the element is truncated.
+        """
+        f.seek(pos)
+        head = f.read(MAX_TLV_HEADER)
+        if not head:
+            return None
+        tag_class, constructed, tag_number, header_length, length = (
+            self.read_tlv_header(head, 0)
+        )
+        if length is not None:
+            return TLV(
+                pos, header_length, length, tag_class, constructed, tag_number, False
+            )
 
-    def parse_binary_data(self, data):
-        """Parse binary ASN.1 data and extract CDR records"""
-        records = []
-        offset = 0
-        record_index = 0
+        window = 64 * 1024
+        while True:
+            f.seek(pos)
+            data = f.read(window)
+            tlv = self.read_tlv(data, 0)
+            if tlv is not None:
+                return tlv._replace(offset=pos)
+            if len(data) < window:
+                return None
+            window *= 2
+
+    def _decode_container_section(self, data, fields):
+        """Decode a header or trailer body into a ``{field name: value}`` dict."""
+        section = {}
+        for tlv in self.iter_tlv(data):
+            name = fields.get(tlv.tag_number, f"[{tlv.tag_number}]")
+            value = data[tlv.value_offset : tlv.value_end]
+            if tlv.constructed:
+                section[name] = self.decode_tlv_tree(value)
+            elif name == "noOfRecords":
+                section[name] = int.from_bytes(value, "big")
+            else:
+                section[name] = value.hex()
+        return section
+
+
+    def iter_record_boundaries(self, filepath, offset=0):
+        """Yield the absolute :class:`TLV` of every record without decoding it.
 
-        while offset < len(data):
+        Container files yield the CallEventRecords inside ``callEventRecords``;
+        other files yield their top-level elements, skipping filler octets.
+        ``offset`` is the file position of the first record to yield.
+        """
+        layout = self.read_container_layout(filepath)
+        with self.map_file(filepath) as view:
+            yield from self._iter_record_tlvs(view, offset, layout)
+
+    def _iter_record_tlvs(self, view, offset=0, layout=None):
+        """Walk record headers of a mapped file from ``offset`` onwards."""
+        if layout:
+            start = max(offset, layout["records_offset"])
+            return self.iter_tlv(view, start, layout["records_end"])
+        return self.iter_tlv(view, offset, skip_filler=True)
+
+    def index_path(self, filepath):
+        """Return the path of the sidecar record index for ``filepath``."""
+        return f"{filepath}.idx"
+
+    def build_record_index(self, filepath):
+        """Write the sidecar index of record offsets, lengths and tags.
+
+        Only tag and length headers are read, so building the index is cheap
+        compared to decoding. Returns the loaded :class:`RecordIndex`.
+        """
+        path = self.index_path(filepath)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(INDEX_HEADER.pack(INDEX_MAGIC, os.path.getsize(filepath)))
             try:
-                # Try to decode ASN.1 structure
-                asn1_object, remainder = decoder.decode(data[offset:])
+                for tlv in self.iter_record_boundaries(filepath):
+                    out.write(
+                        INDEX_ENTRY.pack(
+                            tlv.offset,
+                            tlv.end - tlv.offset,
+                            tlv.tag_class,
+                            tlv.tag_number,
+                        )
+                    )
+            except ValueError as e:
+                self.logger.warning(f"Record index of {filepath} stops early: {e}")
+        os.replace(tmp_path, path)
+        return RecordIndex(path)
 
-                # Process the decoded object
-                record = self.process_asn1_object(asn1_object, record_index)
-                if record:
-                    records.append(record)
-                    record_index += 1
+    def get_record_index(self, filepath, build=True):
+        """Return the :class:`RecordIndex` of ``filepath``.
 
-                # Move to next record
-                consumed = len(data[offset:]) - len(remainder)
-                if consumed == 0:
-                    # Avoid infinite loop
-                    offset += 1
-                else:
-                    offset += consumed
+        A missing or stale sidecar (written for a file of a different size) is
+        rebuilt when ``build`` is true, otherwise ``None`` is returned.
+        """
+        path = self.index_path(filepath)
+        try:
+            with open(path, "rb") as f:
+                magic, size = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic == INDEX_MAGIC and size == os.path.getsize(filepath):
+                return RecordIndex(path)
+        except (OSError, struct.error):
+            pass
+
+        if not build:
+            return None
+        try:
+            return self.build_record_index(filepath)
+        except OSError as e:
+            self.logger.error(f"Failed to build record index for {filepath}: {e}")
+            return None
 
-            except error.PyAsn1Error as e:
-                self.logger.debug(f"ASN.1 decode error at offset {offset}: {str(e)}")
-                # Try BER decoder as fallback
-                try:
-                    asn1_object, remainder = ber_decoder.decode(data[offset:])
-                    record = self.process_asn1_object(asn1_object, record_index)
-                    if record:
-                        records.append(record)
-                        record_index += 1
-
-                    consumed = len(data[offset:]) - len(remainder)
-                    if consumed == 0:
-                        offset += 1
-                    else:
-                        offset += consumed
-
-                except error.PyAsn1Error:
-                    # Skip this byte and continue
-                    offset += 1
-
-            except Exception as e:
-                self.logger.debug(f"General error at offset {offset}: {str(e)}")
-                # Try to find next valid ASN.1 structure
-                next_offset = self.find_next_asn1_start(data, offset + 1)
-                if next_offset == -1:
-                    break
-                offset = next_offset
+    def read_record(self, filepath, record_number):
+        """Decode a single record located through the sidecar index.
+
+        Returns ``None`` when the file has no such record.
+        """
+        index = self.get_record_index(filepath)
+        if index is None or record_number >= len(index):
+            return None
+        entry = index.entry(record_number)
+        return self.decode_record_at(filepath, entry.offset, entry.length, record_number)
+
+    def decode_record_at(self, filepath, offset, length, record_index=0):
+        """Decode the ``length`` bytes of one record stored at ``offset``."""
+        with open(filepath, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if self.spec and self.top_type:
+            return self._decode_spec_record(data, record_index, offset)
+        return self._decode_record(data, record_index, offset)
+
+    def _decode_record(self, data, record_index, offset):
+        """Decode the bytes of one record found at file position ``offset``."""
+        with metrics.timer("decode"):
+            tlv = self.read_tlv(data, 0)
+            decoded = self.decode_tlv(data, tlv)
+        record = self.process_asn1_object(decoded, record_index, data)
+        record["record_offset"] = offset
+        record["record_length"] = len(data)
+        # Decoded from exactly these bytes, so decode_record_at can redo it
+        record["whole_element"] = True
+        return record
+
+    def parse_binary_data(self, data):
+        """Parse binary ASN.1 data and extract CDR records"""
+        records, _ = self.parse_tlv_records(data)
 
         if not records:
             # If no records found with standard decoding, use enhanced BCD analysis
@@ -457,21 +1937,146 @@ class CDRParser:
 
         return records
 
-    def process_asn1_object(self, asn1_object, record_index):
-        """Process a decoded ASN.1 object and extract CDR information"""
+    def read_tlv_header(self, data, offset):
+        """Decode the BER header at ``offset``; see :func:`read_tlv_header`."""
+        return read_tlv_header(data, offset)
+
+    def read_tlv(self, data, offset, end=None):
+        """Return the :class:`TLV` at ``offset``; see :func:`read_tlv`."""
+        return read_tlv(data, offset, end)
+
+    def iter_tlv(self, data, offset=0, end=None, skip_filler=False):
+        """Yield consecutive sibling :class:`TLV` elements between two offsets.
+
+        Iteration stops quietly at the first incomplete element, so the end of
+        the last yielded element tells the caller how much was consumed.
+        ``skip_filler`` steps over ``0x00``/``0xFF`` padding between elements.
+        Malformed headers raise ``ValueError``; there is no resynchronisation
+        at speculative offsets.
+        """
+        if end is None:
+            end = len(data)
+        pos = offset
+        while pos < end:
+            if skip_filler and data[pos] in FILLER_BYTES:
+                pos += 1
+                continue
+            tlv = self.read_tlv(data, pos, end)
+            if tlv is None:
+                return
+            yield tlv
+            pos = tlv.end
+
+    def parse_tlv_records(self, data, start_record_index=0, max_records=None):
+        """Decode each complete top-level element in ``data`` as one record.
+
+        Returns ``(records, consumed)`` where ``consumed`` is the number of
+        bytes up to the end of the last decoded record (plus any filler). An
+        element whose contents cannot be decoded becomes a raw binary analysis
+        record; only a malformed top-level header stops the walk.
+        """
+        records = []
+        consumed = 0
+        record_index = start_record_index
+        try:
+            for tlv in self.iter_tlv(data, skip_filler=True):
+                if max_records is not None and len(records) >= max_records:
+                    break
+                try:
+                    record = self.process_asn1_object(
+                        self.decode_tlv(data, tlv), record_index, data[tlv.offset : tlv.end]
+                    )
+                except ValueError as e:
+                    # The element is delimited, so only it is lost
+                    metrics.record_decode_failure("ber", tlv.offset)
+                    record = self.analyze_binary_chunk(
+                        bytes(data[tlv.offset : tlv.end]), record_index
+                    )
+                    record["decode_error"] = str(e)
+                records.append(record)
+                record_index += 1
+                consumed = tlv.end
+            else:
+                # Only trailing filler (or nothing) remains after the last record
+                while consumed < len(data) and data[consumed] in FILLER_BYTES:
+                    consumed += 1
+        except ValueError as e:
+            self.logger.debug(f"Malformed BER header after offset {consumed}: {e}")
+
+        return records, consumed
+
+    def decode_tlv(self, data, tlv):
+        """Decode exactly one delimited element.
+
+        Universal-class elements go to pyasn1 first; anything pyasn1 cannot
+        handle without a spec (context tags, vendor extensions) is converted
+        into a tag tree by :meth:`decode_tlv_tree`.
+        """
+        if tlv.tag_class == TAG_CLASS_UNIVERSAL:
+            substrate = bytes(data[tlv.offset : tlv.end])
+            for codec in (decoder, ber_decoder):
+                try:
+                    asn1_object, _ = codec.decode(substrate)
+                    return asn1_object
+                except (error.PyAsn1Error, OverflowError, ValueError):
+                    continue
+        return self.decode_tlv_tree(data, tlv.offset, tlv.end)
+
+    def decode_tlv_tree(self, data, offset=0, end=None):
+        """Convert BER elements into a dict keyed by tag, e.g. ``"[3]"``.
+
+        Primitive values are returned as hex strings and repeated tags are
+        collected into lists.
+        """
+        result = {}
+        for tlv in self.iter_tlv(data, offset, end):
+            if tlv.tag_class == TAG_CLASS_CONTEXT:
+                key = f"[{tlv.tag_number}]"
+            else:
+                key = f"[{TAG_CLASS_NAMES[tlv.tag_class]} {tlv.tag_number}]"
+
+            if tlv.constructed:
+                value = self.decode_tlv_tree(data, tlv.value_offset, tlv.value_end)
+            else:
+                value = bytes(data[tlv.value_offset : tlv.value_end]).hex()
+
+            if key not in result:
+                result[key] = value
+            elif isinstance(result[key], list):
+                result[key].append(value)
+            else:
+                result[key] = [result[key], value]
+        return result
+
+    def process_asn1_object(self, asn1_object, record_index, data=None):
+        """Process a decoded ASN.1 object and extract CDR information
+
+        When the encoded record ``data`` is a CallEventRecord, its record type
+        is the CHOICE alternative and fields are read from the tag paths of
+        its field mapping profile; types without a profile get no fields.
+        Other records fall back to guessing them from the decoded values.
+        """
+        with metrics.timer("asn1_to_dict"):
+            asn1_dict = self.asn1_to_dict(asn1_object)
         record = {
             "record_index": record_index,
             "record_type": "asn1_decoded",
-            "raw_asn1_structure": self.asn1_to_dict(asn1_object),
+            "raw_asn1_structure": asn1_dict,
         }
 
         # Try to extract common telecom CDR fields
         try:
-            # Convert ASN.1 object to a more workable format
-            asn1_dict = self.asn1_to_dict(asn1_object)
-
-            # Try to identify and extract common CDR fields
-            self.extract_cdr_fields(asn1_dict, record)
+            with metrics.timer("extract_fields"):
+                mapped = (
+                    self.field_mapping.extract(data, self.field_decoders)
+                    if data is not None
+                    else None
+                )
+                if mapped is not None:
+                    record["record_type"], fields = mapped
+                    record.update(fields)
+                else:
+                    self.extract_cdr_fields(asn1_dict, record)
 
         except Exception as e:
             self.logger.debug(f"Error extracting CDR fields: {str(e)}")
@@ -481,6 +2086,9 @@ class CDRParser:
 
     def asn1_to_dict(self, asn1_object):
         """Convert ASN.1 object to dictionary for easier processing"""
+        if isinstance(asn1_object, dict):
+            # Already a tag tree from decode_tlv_tree
+            return asn1_object
         if hasattr(asn1_object, "hasValue") and asn1_object.hasValue():
             if hasattr(asn1_object, "__iter__"):
                 # It's a sequence or choice
@@ -507,11 +2115,10 @@ class CDRParser:
 
     def extract_cdr_fields(self, asn1_dict, record):
         """Extract common CDR fields from the ASN.1 dictionary with improved pattern matching"""
-
-        # Extract all numeric strings that could be phone numbers
-        phone_numbers = self.extract_phone_numbers_from_dict(asn1_dict)
+        scan = self.scan_values(asn1_dict)
 
         # Assign phone numbers (first two as calling/called)
+        phone_numbers = scan["phone_numbers"]
         if len(phone_numbers) >= 2:
             record["calling_number"] = phone_numbers[0]
             record["called_number"] = phone_numbers[1]
@@ -522,180 +2129,119 @@ class CDRParser:
         if phone_numbers:
             record["all_phone_numbers"] = phone_numbers
 
-        # Look for timestamps and durations
-        timestamps = self.extract_timestamps_from_dict(asn1_dict)
-        durations = self.extract_durations_from_dict(asn1_dict)
-
         # Assign timestamps
+        timestamps = scan["timestamps"]
         if len(timestamps) >= 2:
             record["start_time"] = timestamps[0]
             record["end_time"] = timestamps[1]
             # Calculate duration if both times available
-            if timestamps[0] and timestamps[1]:
-                try:
-                    duration = (timestamps[1] - timestamps[0]).total_seconds()
-                    if duration > 0:
-                        record["call_duration"] = int(duration)
-                except Exception:
-                    pass
+            duration = (timestamps[1] - timestamps[0]).total_seconds()
+            if duration > 0:
+                record["call_duration"] = int(duration)
         elif len(timestamps) == 1:
             record["start_time"] = timestamps[0]
 
         # Use extracted duration if no calculated duration
-        if "call_duration" not in record and durations:
-            record["call_duration"] = durations[0]
-
-        # Determine record type based on content analysis
-        record["record_type"] = self.determine_record_type(asn1_dict)
+        if "call_duration" not in record and scan["durations"]:
+            record["call_duration"] = scan["durations"][0]
 
-        # Extract additional metadata
-        self.extract_additional_fields(asn1_dict, record)
+        record["record_type"] = scan["record_type"]
+        record.update(scan["identifiers"])
 
-    def extract_phone_numbers_from_dict(self, data):
-        """Extract potential phone numbers from ASN.1 data"""
-        import re
+    def scan_values(self, data):
+        """Collect the values extract_cdr_fields derives fields from.
 
+        Keys and leaf values of ``data`` are visited once, in the order they
+        appear in ``str(data)``. String leaves supply phone numbers (7-15
+        digit words), timestamps and durations (1-6 digit words up to a
+        day); keys and all leaves are searched for record type words and for
+        IMSI, IMEI and cell id digit words.
+        """
         phone_numbers = []
-
-        def extract_from_value(value):
-            if isinstance(value, str):
-                # Look for sequences of digits that could be phone numbers
-                matches = re.findall(r"\b\d{7,15}\b", value)
-                for match in matches:
-                    if match not in phone_numbers and len(match) >= 7:
-                        phone_numbers.append(match)
-            elif isinstance(value, dict):
-                for v in value.values():
-                    extract_from_value(v)
-            elif isinstance(value, (list, tuple)):
-                for item in value:
-                    extract_from_value(item)
-
-        extract_from_value(data)
-        return phone_numbers[:10]  # Limit to first 10
-
-    def extract_timestamps_from_dict(self, data):
-        """Extract potential timestamps from ASN.1 data"""
         timestamps = []
-
-        def extract_from_value(value):
-            if isinstance(value, str):
-                # Try to parse as timestamp
-                parsed_time = self.parse_timestamp(value)
-                if parsed_time and parsed_time not in timestamps:
-                    timestamps.append(parsed_time)
-            elif isinstance(value, dict):
-                for v in value.values():
-                    extract_from_value(v)
-            elif isinstance(value, (list, tuple)):
-                for item in value:
-                    extract_from_value(item)
-
-        extract_from_value(data)
-        return timestamps[:5]  # Limit to first 5
-
-    def extract_durations_from_dict(self, data):
-        """Extract potential call durations from ASN.1 data"""
         durations = []
+        identifiers = {}
+        type_rank = len(RECORD_TYPE_INDICATORS)
+
+        stack = [data]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                for key, item in reversed(value.items()):
+                    stack.append(item)
+                    stack.append(_Key(key))
+                continue
+            if isinstance(value, (list, tuple)):
+                stack.extend(reversed(value))
+                continue
 
-        def extract_from_value(value):
-            if isinstance(value, str):
-                # Look for numeric values that could be durations
-                import re
-
-                matches = re.findall(r"\b\d{1,6}\b", value)
-                for match in matches:
-                    duration = int(match)
-                    # Reasonable call duration range (1 sec to 24 hours)
-                    if 1 <= duration <= 86400:
-                        durations.append(duration)
-            elif isinstance(value, dict):
-                for v in value.values():
-                    extract_from_value(v)
-            elif isinstance(value, (list, tuple)):
-                for item in value:
-                    extract_from_value(item)
-
-        extract_from_value(data)
-        return durations[:3]  # Limit to first 3
-
-    def determine_record_type(self, data):
-        """Determine record type based on ASN.1 content"""
-        data_str = str(data).lower()
-
-        # Voice call indicators
-        if any(
-            indicator in data_str
-            for indicator in ["voice", "call", "speech", "gsm", "circuit"]
-        ):
-            return "voice_call"
-
-        # SMS indicators
-        elif any(
-            indicator in data_str for indicator in ["sms", "message", "short", "text"]
-        ):
-            return "sms"
-
-        # Data session indicators
-        elif any(
-            indicator in data_str
-            for indicator in ["data", "gprs", "pdp", "internet", "packet"]
-        ):
-            return "data_session"
-
-        # MMS indicators
-        elif any(indicator in data_str for indicator in ["mms", "multimedia"]):
-            return "mms"
+            is_string = isinstance(value, str)
+            if isinstance(value, _Key):
+                text = value.text
+            elif is_string:
+                text = value
+                if len(timestamps) < MAX_TIMESTAMPS:
+                    parsed_time = self.parse_timestamp(value)
+                    if parsed_time and parsed_time not in timestamps:
+                        timestamps.append(parsed_time)
+            else:
+                text = repr(value)
 
-        # If we found phone numbers, likely a voice call
-        elif "calling_number" in str(data) or "called_number" in str(data):
-            return "voice_call"
+            if type_rank:
+                lowered = text.lower()
+                for rank, (_, words) in enumerate(RECORD_TYPE_INDICATORS[:type_rank]):
+                    if any(word in lowered for word in words):
+                        type_rank = rank
+                        break
 
+            for word in DIGIT_WORD.findall(text):
+                digits = len(word)
+                if is_string:
+                    if (
+                        7 <= digits <= 15
+                        and len(phone_numbers) < MAX_PHONE_NUMBERS
+                        and word not in phone_numbers
+                    ):
+                        phone_numbers.append(word)
+                    if digits <= 6 and len(durations) < MAX_DURATIONS and 1 <= int(word) <= 86400:
+                        durations.append(int(word))
+                if word.isascii():
+                    for field, shortest, longest in IDENTIFIER_LENGTHS:
+                        if field not in identifiers and shortest <= digits <= longest:
+                            identifiers[field] = word
+
+        if type_rank < len(RECORD_TYPE_INDICATORS):
+            record_type = RECORD_TYPE_INDICATORS[type_rank][0]
         else:
-            return "telecom_record"  # More specific than 'unknown'
-
-    def extract_additional_fields(self, asn1_dict, record):
-        """Extract additional CDR fields like IMSI, IMEI, cell info"""
-
-        def search_for_patterns(data, patterns, field_name):
-            import re
-
-            for pattern_name, pattern in patterns.items():
-                matches = re.findall(pattern, str(data))
-                if matches:
-                    record[field_name] = matches[0]
-                    break
-
-        # Common telecom patterns
-        patterns = {
-            "imsi": r"\b[0-9]{15}\b",  # IMSI (15 digits)
-            "imei": r"\b[0-9]{14,15}\b",  # IMEI (14-15 digits)
-            "cell_id": r"\b[0-9]{4,8}\b",  # Cell ID
+            record_type = "telecom_record"  # More specific than 'unknown'
+        return {
+            "phone_numbers": phone_numbers,
+            "timestamps": timestamps,
+            "durations": durations,
+            "record_type": record_type,
+            "identifiers": identifiers,
         }
 
-        # Look for specific telecom identifiers
-        search_for_patterns(asn1_dict, {"imsi": patterns["imsi"]}, "imsi")
-        search_for_patterns(asn1_dict, {"imei": patterns["imei"]}, "imei")
-        search_for_patterns(asn1_dict, {"cell_id": patterns["cell_id"]}, "cell_id")
-
     def parse_timestamp(self, timestamp_str):
         """Try to parse various timestamp formats"""
-        if not timestamp_str:
+        if not timestamp_str or not TIMESTAMP_CHARS.fullmatch(timestamp_str):
             return None
 
-        # Common timestamp formats in telecom
-        formats = [
-            "%Y%m%d%H%M%S",
-            "%Y-%m-%d %H:%M:%S",
-            "%Y%m%d%H%M%S%f",
-            "%d/%m/%Y %H:%M:%S",
-            "%Y-%m-%dT%H:%M:%S",
-            "%Y-%m-%dT%H:%M:%SZ",
-        ]
-
-        for fmt in formats:
+        for pattern in TIMESTAMP_PATTERNS:
+            match = pattern.match(timestamp_str)
+            if match is None or match.end() != len(timestamp_str):
+                continue
+            fields = match.groupdict()
             try:
-                return datetime.strptime(timestamp_str, fmt)
+                return datetime(
+                    int(fields["year"]),
+                    int(fields["month"]),
+                    int(fields["day"]),
+                    int(fields["hour"]),
+                    int(fields["minute"]),
+                    int(fields["second"]),
+                    int((fields.get("microsecond") or "0").ljust(6, "0")),
+                )
             except ValueError:
                 continue
 
@@ -738,8 +2284,6 @@ class CDRParser:
         }
 
         # Try to find phone number patterns (sequences of digits)
-        import re
-
         # Extract potential phone numbers (6-15 digits)
         phone_pattern = rb"[\d]{6,15}"
         phone_matches = re.findall(phone_pattern, data)
@@ -770,127 +2314,30 @@ class CDRParser:
         return records
 
     def parse_large_file(self, filepath):
-        """Parse large CDR files in chunks to avoid memory issues"""
+        """Parse large CDR files record by record.
+
+        Use :meth:`iter_records` directly to avoid holding every record in
+        memory at once.
+        """
         records = []
-        chunk_size = 10 * 1024 * 1024  # 10MB chunks
-        record_index = 0
 
         try:
-            with open(filepath, "rb") as f:
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-
-                    # Try to find record boundaries to avoid splitting records
-                    if len(chunk) == chunk_size:
-                        # Look for potential ASN.1 record starts in the last 1KB
-                        boundary_search = chunk[-1024:]
-                        boundary_pos = -1
-
-                        for i in range(len(boundary_search) - 1, 0, -1):
-                            if boundary_search[i] in [0x30, 0x31, 0x02, 0x04]:
-                                boundary_pos = len(chunk) - len(boundary_search) + i
-                                break
-
-                        if boundary_pos > 0:
-                            # Split at the boundary
-                            process_chunk = chunk[:boundary_pos]
-                            # Put the remainder back for next iteration
-                            f.seek(f.tell() - (len(chunk) - boundary_pos))
-                            chunk = process_chunk
-
-                    # Process this chunk
-                    chunk_records = self.parse_binary_data_chunk(chunk, record_index)
-                    records.extend(chunk_records)
-                    record_index += len(chunk_records)
-
-                    # Limit total records to prevent memory issues
-                    if len(records) > 10000:
-                        self.logger.warning(
-                            "Limiting parsing to first 10000 records for performance"
-                        )
-                        break
+            records = list(self.iter_records(filepath))
 
         except Exception as e:
             self.logger.error(f"Error processing large file: {str(e)}")
-            # Return any records we managed to parse
-            if not records:
-                # Use enhanced binary analysis with BCD phone extraction
-                self.logger.info("Falling back to enhanced BCD parsing for large file")
-                records = self.parse_raw_binary_file(filepath)
+
+        # Return any records we managed to parse
+        if not records:
+            # Use enhanced binary analysis with BCD phone extraction
+            self.logger.info("Falling back to enhanced BCD parsing for large file")
+            records = self.parse_raw_binary_file(filepath)
 
         return records
 
     def parse_binary_data_chunk(self, data, start_record_index=0):
         """Parse a chunk of binary data with limited scope and better error handling"""
-        records = []
-        offset = 0
-        record_index = start_record_index
-        max_records_per_chunk = 100  # Reduced limit for better performance
-        consecutive_failures = 0
-        max_consecutive_failures = 1000  # Stop after too many failures
-
-        while (
-            offset < len(data)
-            and len(records) < max_records_per_chunk
-            and consecutive_failures < max_consecutive_failures
-        ):
-            try:
-                # Try to decode ASN.1 structure
-                remaining = data[offset:]
-                if len(remaining) < 2:  # Not enough data for ASN.1
-                    break
-
-                # Limit the data we try to decode to prevent huge integer issues
-                decode_chunk = remaining[
-                    : min(10000, len(remaining))
-                ]  # Max 10KB per decode attempt
-
-                asn1_object, remainder = decoder.decode(decode_chunk)
-
-                # Process the decoded object
-                record = self.process_asn1_object(asn1_object, record_index)
-                if record:
-                    records.append(record)
-                    record_index += 1
-                    consecutive_failures = 0  # Reset failure counter on success
-
-                # Move to next record
-                consumed = len(decode_chunk) - len(remainder)
-                if consumed == 0:
-                    offset += 1
-                    consecutive_failures += 1
-                else:
-                    offset += consumed
-
-            except (error.PyAsn1Error, OverflowError, ValueError):
-                # Try BER decoder as fallback
-                try:
-                    remaining = data[offset:]
-                    decode_chunk = remaining[: min(10000, len(remaining))]
-                    asn1_object, remainder = ber_decoder.decode(decode_chunk)
-                    record = self.process_asn1_object(asn1_object, record_index)
-                    if record:
-                        records.append(record)
-                        record_index += 1
-                        consecutive_failures = 0
-
-                    consumed = len(decode_chunk) - len(remainder)
-                    if consumed == 0:
-                        offset += 1
-                        consecutive_failures += 1
-                    else:
-                        offset += consumed
-
-                except (error.PyAsn1Error, OverflowError, ValueError):
-                    offset += 1
-                    consecutive_failures += 1
-
-            except Exception as e:
-                self.logger.debug(f"Unexpected error at offset {offset}: {str(e)}")
-                offset += 1
-                consecutive_failures += 1
+        records, _ = self.parse_tlv_records(data, start_record_index)
 
         # If we couldn't decode anything, try raw binary analysis
         if not records and len(data) > 0:
@@ -903,8 +2350,6 @@ class CDRParser:
 
     def analyze_binary_chunk(self, data, record_index):
         """Analyze binary data when ASN.1 decoding fails"""
-        import re
-
         record = {
             "record_index": record_index,
             "record_type": "raw_binary_analysis",
@@ -980,6 +2425,11 @@ class CDRParser:
                 f"Raw binary parser: Found {len(bcd_phones)} BCD phone numbers"
             )
 
+            # Whole-file scans shared by every record
+            timestamps = self.extract_timestamps_from_binary(data, base_time)
+            durations = self.extract_durations_from_binary(data)
+            network_patterns = re.findall(rb"[A-Z]{3,}[A-Z0-9_]{3,}", data)
+
             # Create one record per extracted phone number when available
             num_records = len(bcd_phones) if bcd_phones else 50
             for i in range(num_records):
@@ -1004,10 +2454,6 @@ class CDRParser:
                     # Store sample of all phone numbers
                     record["all_phone_numbers"] = bcd_phones[:20]
 
-                # Extract timestamps and durations
-                timestamps = self.extract_timestamps_from_binary(data, base_time)
-                durations = self.extract_durations_from_binary(data)
-
                 if timestamps:
                     if i < len(timestamps):
                         record["start_time"] = timestamps[i]
@@ -1017,10 +2463,7 @@ class CDRParser:
                 if durations and i < len(durations):
                     record["call_duration"] = durations[i]
 
-                # Extract network elements for this record
-                import re
-
-                network_patterns = re.findall(rb"[A-Z]{3,}[A-Z0-9_]{3,}", data)
+                # Network elements found in the file
                 if network_patterns:
                     networks = [
                         p.decode("ascii", errors="ignore") for p in network_patterns[:5]
@@ -1202,32 +2645,15 @@ class CDRParser:
 
         # 2) BCD phones (limit collection aggressively)
         all_phone_numbers = []
-        for i in range(0, min(len(scan_data) - 8, 256 * 1024)):
-            chunk = scan_data[i : i + 8]
-            number = ""
-            valid = True
-            for byte in chunk:
-                hi = (byte >> 4) & 0x0F
-                lo = byte & 0x0F
-                if hi <= 9:
-                    number += str(hi)
-                elif hi == 0xF:
-                    break
-                else:
-                    valid = False
-                    break
-                if lo <= 9:
-                    number += str(lo)
-                elif lo == 0xF:
-                    break
-                else:
-                    valid = False
-                    break
-            if valid and 10 <= len(number) <= 15 and number.isdigit():
-                if number not in all_phone_numbers:
-                    all_phone_numbers.append(number)
-                if len(all_phone_numbers) >= 100:
-                    break
+        seen = set()
+        for _, number in self.find_bcd_runs(
+            scan_data, min(len(scan_data) - 8, 256 * 1024)
+        ):
+            if number not in seen:
+                seen.add(number)
+                all_phone_numbers.append(number)
+            if len(all_phone_numbers) >= 100:
+                break
 
         # 3) ASCII phones
         phone_patterns = [rb"91[0-9]{10}", rb"[0-9]{10,15}", rb"[0-9]{7,10}"]
@@ -1236,7 +2662,8 @@ class CDRParser:
                 if len(all_phone_numbers) >= 100:
                     break
                 phone = m.decode("ascii", errors="ignore")
-                if phone not in all_phone_numbers:
+                if phone not in seen:
+                    seen.add(phone)
                     all_phone_numbers.append(phone)
             if len(all_phone_numbers) >= 100:
                 break
@@ -1304,8 +2731,6 @@ class CDRParser:
 
     def analyze_telecom_chunk(self, chunk, record_index):
         """Analyze a chunk of telecom binary data"""
-        import re
-
         record = {
             "record_index": record_index,
             "record_type": "telecom_record",
@@ -1345,102 +2770,114 @@ class CDRParser:
 
         return record
 
-    def extract_bcd_phone_numbers(self, data):
-        """Extract BCD-encoded phone numbers from binary data"""
-        bcd_numbers = []
-
-        # Scan through the data looking for BCD patterns
-        for i in range(0, len(data) - 5, 1):
-            chunk = data[i : i + 8]  # 8 bytes can hold up to 16 digits
-
-            # Try to decode as BCD
-            try:
-                number = ""
-                valid_bcd = True
-
-                for byte in chunk:
-                    high_nibble = (byte >> 4) & 0x0F
-                    low_nibble = byte & 0x0F
-
-                    # Check if nibbles are valid BCD (0-9, 0xF for padding)
-                    if high_nibble <= 9:
-                        number += str(high_nibble)
-                    elif high_nibble == 0xF:
-                        break  # End of number padding
-                    else:
-                        valid_bcd = False
-                        break
+    def find_bcd_runs(self, data, stop=None):
+        """Yield ``(position, number)`` for BCD numbers of 10-15 digits.
 
-                    if low_nibble <= 9:
-                        number += str(low_nibble)
-                    elif low_nibble == 0xF:
-                        break  # End of number padding
-                    else:
-                        valid_bcd = False
-                        break
+        A number starts at any byte before ``stop``, spans at most 8 bytes and
+        ends at a 0xF filler nibble or after those 8 bytes; any other non-digit
+        nibble invalidates it. Candidates may overlap. The scan is vectorised
+        with NumPy when it is available.
+        """
+        if stop is None:
+            stop = len(data)
+        stop = min(stop, len(data))
+        if stop <= 0:
+            return
+        if np is None:
+            yield from self._find_bcd_runs_python(data, stop)
+            return
+
+        size = len(data)
+        for block_start in range(0, stop, BCD_SCAN_BLOCK):
+            block_stop = min(block_start + BCD_SCAN_BLOCK, stop)
+            # Eight bytes of look-ahead so numbers may cross the block edge
+            window = np.frombuffer(
+                data,
+                dtype=np.uint8,
+                count=min(block_stop + 8, size) - block_start,
+                offset=block_start,
+            )
+            nibbles = np.empty(window.size * 2, dtype=np.uint8)
+            nibbles[0::2] = window >> 4
+            nibbles[1::2] = window & 0x0F
+            total = nibbles.size
+
+            # Index of the first non-digit nibble at or after every nibble
+            positions = np.arange(total, dtype=np.int32)
+            next_stop = np.where(nibbles > 9, positions, total).astype(np.int32)
+            next_stop = np.minimum.accumulate(next_stop[::-1])[::-1]
+
+            starts = positions[: (block_stop - block_start) * 2 : 2]
+            limit = np.minimum(16, total - starts)
+            run = next_stop[starts] - starts
+            terminated = run < limit
+            terminator = nibbles[np.minimum(starts + run, total - 1)]
+            digits = np.minimum(run, limit)
+            found = np.flatnonzero(
+                np.where(terminated, terminator == 0xF, True)
+                & (digits >= 10)
+                & (digits <= 15)
+            )
 
-                # Filter valid phone numbers
-                if (
-                    valid_bcd
-                    and len(number) >= 10
-                    and len(number) <= 15
-                    and number.isdigit()
-                    and number not in bcd_numbers
-                ):
+            ascii_digits = nibbles + ord("0")
+            for index in found.tolist():
+                start = index * 2
+                number = ascii_digits[start : start + digits[index]].tobytes()
+                yield block_start + index, number.decode("ascii")
 
-                    # Additional validation for realistic phone numbers
-                    if (
-                        number.startswith("91")
-                        and len(number) >= 12  # Indian international
-                        or (len(number) == 10 and number[0] in "6789")  # Indian mobile
-                        or (len(number) >= 11 and number[0] != "0")
-                    ):  # International format
-                        bcd_numbers.append(number)
+    def _find_bcd_runs_python(self, data, stop):
+        """Pure Python fallback for :meth:`find_bcd_runs`."""
+        for i in range(stop):
+            digits = []
+            valid = True
+            for byte in data[i : i + 8]:
+                nibble = byte >> 4
+                if nibble > 9:
+                    valid = nibble == 0xF
+                    break
+                digits.append(nibble)
+                nibble = byte & 0x0F
+                if nibble > 9:
+                    valid = nibble == 0xF
+                    break
+                digits.append(nibble)
+            if valid and 10 <= len(digits) <= 15:
+                yield i, "".join(map(str, digits))
 
-                        # Limit collection to reasonable number for performance
-                        if len(bcd_numbers) >= 1000:
-                            break
+    def extract_bcd_phone_numbers(self, data):
+        """Extract BCD-encoded phone numbers from binary data"""
+        bcd_numbers = {}
 
-            except Exception:
+        for _, number in self.find_bcd_runs(data, len(data) - 5):
+            if number in bcd_numbers:
                 continue
 
-        return list(set(bcd_numbers))  # Remove duplicates
+            # Additional validation for realistic phone numbers
+            if (
+                number.startswith("91")
+                and len(number) >= 12  # Indian international
+                or (len(number) == 10 and number[0] in "6789")  # Indian mobile
+                or (len(number) >= 11 and number[0] != "0")
+            ):  # International format
+                bcd_numbers[number] = None
+
+                # Limit collection to reasonable number for performance
+                if len(bcd_numbers) >= 1000:
+                    break
+
+        return list(bcd_numbers)
 
     def extract_bcd_sequences(self, data):
         """Return positions and numbers for BCD-encoded phone numbers."""
         sequences = []
-        i = 0
-        while i < len(data) - 5:
-            chunk = data[i : i + 8]
-            number = ""
-            length = 0
-            valid = True
-            for byte in chunk:
-                high = (byte >> 4) & 0x0F
-                low = byte & 0x0F
-                if high <= 9:
-                    number += str(high)
-                elif high == 0xF:
-                    length += 1
-                    break
-                else:
-                    valid = False
-                    break
-                if low <= 9:
-                    number += str(low)
-                elif low == 0xF:
-                    length += 1
-                    break
-                else:
-                    valid = False
-                    break
-                length += 1
-            if valid and 10 <= len(number) <= 15 and number.isdigit():
-                bytes_used = (len(number) + 1) // 2
-                sequences.append((i, bytes_used, number))
-                i += bytes_used
-            else:
-                i += 1
+        next_pos = 0
+        for pos, number in self.find_bcd_runs(data, len(data) - 5):
+            # Matches do not overlap: scanning resumes after the last number
+            if pos < next_pos:
+                continue
+            bytes_used = (len(number) + 1) // 2
+            sequences.append((pos, bytes_used, number))
+            next_pos = pos + bytes_used
         return sequences
 
     def encode_bcd_phone_number(self, number, length):
@@ -1457,6 +2894,64 @@ class CDRParser:
             encoded.append((hi << 4) | lo)
         return bytes(encoded)
 
+    def patch_record_numbers(self, filepath, offset, length, changes):
+        """Replace phone numbers inside one record of ``filepath`` in place.
+
+        ``changes`` maps each field to its ``(old, new)`` numbers. See
+        :meth:`patch_records`; returns the fields that were patched.
+        """
+        return self.patch_records(filepath, [(offset, length, changes)])[0]
+
+    def patch_records(self, filepath, patches):
+        """Replace phone numbers inside records of ``filepath`` in place.
+
+        ``patches`` is a list of ``(offset, length, changes)`` tuples where
+        ``changes`` maps a field such as ``"calling_number"`` to its
+        ``(old, new)`` numbers. Each field is rewritten only in the element
+        it is read from (see :meth:`FieldMapping.locate`), in the same number
+        of octets, so record and container lengths are unchanged. Records are
+        visited in offset order through a single descriptor and the file is
+        synced once. Every replacement is checked before the first write;
+        ``ValueError`` is raised if the element of a field is ambiguous,
+        holds neither number, or the new number does not fit. A field
+        already holding its new number counts as patched, so applying the
+        same patches twice is harmless; fields without an element in the
+        record are left out. Returns the patched fields of each record, in
+        the order of ``patches``.
+        """
+        patched = [[] for _ in patches]
+        writes = []
+        fd = os.open(filepath, os.O_RDWR)
+        try:
+            for i in sorted(range(len(patches)), key=lambda i: patches[i][0]):
+                offset, length, changes = patches[i]
+                data = os.pread(fd, length, offset)
+                for field, (old_number, new_number) in changes.items():
+                    encode = FIELD_ENCODERS.get(field)
+                    if encode is None:
+                        raise ValueError(f"{field} cannot be patched in the binary record")
+                    tlv = self.field_mapping.locate(data, field, self.field_decoders)
+                    if tlv is None:
+                        continue
+                    value = data[tlv.value_offset : tlv.value_end]
+                    current = self.field_decoders[field](value)
+                    if current != new_number:
+                        if current != old_number:
+                            raise ValueError(
+                                f"{field} of the record at offset {offset} is "
+                                f"{current}, not {old_number}"
+                            )
+                        writes.append((offset + tlv.value_offset, encode(new_number, value)))
+                    patched[i].append(field)
+
+            for position, encoded in writes:
+                os.pwrite(fd, encoded, position)
+            if writes:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        return patched
+
     def save_records_to_file(self, filepath, records):
         """Save updated calling numbers back to the binary file."""
         try:
@@ -1481,24 +2976,27 @@ class CDRParser:
     def extract_timestamps_from_binary(self, data, base_time=None):
         """Extract timestamps from binary telecom data.
 
-        Returns a list of ``datetime`` objects. If no timestamps are found in the
-        binary payload, sample timestamps are generated. ``base_time`` can be
+        Returns a list of ``datetime`` objects: BCD TimeStamps as local times,
+        or ASCII timestamps when the data holds no BCD TimeStamp. If no
+        timestamps are found in the binary payload, sample timestamps are
+        generated. ``base_time`` can be
         provided to seed the generated values (e.g. derived from the filename).
         """
-        import re
-        from datetime import datetime, timedelta
-
         timestamps: list[datetime] = []
 
-        timestamp_patterns = [
-            rb"20[0-9]{12}",  # 20YYMMDDHHMMSS format
-            rb"[0-9]{12}",  # YYMMDDHHMMSS format
-            rb"[0-9]{10}",  # UNIX timestamp format
-            rb"[0-9]{8}",  # YYYYMMDD format
-        ]
+        self.timestamps.clear()
+        for match in BINARY_BCD_TIMESTAMP.finditer(data):
+            try:
+                timestamps.append(epoch_to_local(*self.timestamps(match.group())))
+            except ValueError:
+                continue
+            if len(timestamps) >= 1000:
+                break
 
-        for pattern in timestamp_patterns:
-            matches = re.findall(pattern, data)
+        # The ASCII patterns also match runs of BCD octets that happen to be
+        # digits, so they are only a fallback for data without TimeStamps
+        for pattern in BINARY_TIMESTAMP_PATTERNS if not timestamps else ():
+            matches = pattern.findall(data)
             for match in matches:
                 try:
                     ts_str = match.decode("ascii")
@@ -0,0 +1,230 @@
+"""Edit sessions that batch number corrections into one file write.
+
+While a session is open, number changes made through the edit form are
+journaled in the ``pending_edit`` table instead of being patched into the
+uploaded file one at a time. Applying the session patches all of them in a
+single offset-ordered pass. The journal is committed before the file is
+touched and edits are only marked applied after the file has been synced, so
+a session interrupted while applying is applied again on the next start;
+edits that already reached the file are left as they are. The process
+applying a session owns it through a lease (see :mod:`leases`), and only
+sessions whose owner stopped sending heartbeats are taken over.
+"""
+
+import os
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from app import app, db
+from models import CDRRecord, EditSession, PendingEdit
+from cdr_parser import CDRParser, FIELD_MAPPING
+from storage import detach_upload
+import leases
+
+leases.track(EditSession, ("applying",))
+
+
+def open_session(cdr_file):
+    """Start an edit session for ``cdr_file`` and return it."""
+    session = active_session(cdr_file.id)
+    if session is not None:
+        return session
+    session = EditSession(file_id=cdr_file.id)
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def active_session(file_id):
+    """Return the open or applying edit session of a file, if any.
+
+    A session left applying by a process that has gone is reopened first, so
+    it can be applied again instead of blocking the file.
+    """
+    reopen_stale_sessions(EditSession.file_id == file_id)
+    return (
+        EditSession.query.filter_by(file_id=file_id)
+        .filter(EditSession.status.in_(("open", "applying")))
+        .order_by(EditSession.id.desc())
+        .first()
+    )
+
+
+def journal_edit(session, record, field, old_number, new_number):
+    """Record that ``field`` of ``record`` changed from ``old_number``.
+
+    Successive edits of the same number are coalesced into one journal entry
+    from the number in the file to the latest value, and dropped when the
+    number is changed back or cleared; clearing a number, like outside a
+    session, only changes the database. Returns False when the record has no element
+    holding ``field`` in the file to patch; raises ``ValueError`` when more
+    than one element holds it. The caller commits.
+    """
+    edit = PendingEdit.query.filter_by(
+        session_id=session.id, record_id=record.id, field=field, applied=False
+    ).first()
+    if edit is not None:
+        if new_number and new_number != edit.old_number:
+            edit.new_number = new_number
+        else:
+            db.session.delete(edit)
+        return True
+
+    if not old_number or not new_number or old_number == new_number:
+        return True
+    location = record.binary_location()
+    if location is None:
+        return False
+    # Checked now, so an edit that cannot be patched is refused here rather
+    # than failing the whole session when it is applied
+    filepath, offset, length = location
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        if FIELD_MAPPING.locate(f.read(length), field) is None:
+            return False
+    db.session.add(
+        PendingEdit(
+            session_id=session.id,
+            record_id=record.id,
+            field=field,
+            old_number=old_number,
+            new_number=new_number,
+            record_offset=location[1],
+            record_length=location[2],
+        )
+    )
+    return True
+
+
+def apply_session(session):
+    """Write the pending edits of ``session`` to the file in one pass.
+
+    Returns the edits whose field has no element in their record. On
+    error nothing is written and the session is left open. Raises
+    ``ValueError`` if the session is no longer open, e.g. because another
+    process started applying it.
+    """
+    if not claim_session(session, EditSession.status == "open"):
+        raise ValueError("Edit session is not open")
+    return write_session(session)
+
+
+def claim_session(session, *conditions):
+    """Mark ``session`` as applied by this process if it matches ``conditions``.
+
+    The conditional UPDATE lets only one process claim a session.
+    """
+    claimed = db.session.execute(
+        db.update(EditSession)
+        .where(EditSession.id == session.id, *conditions)
+        .values(
+            status="applying",
+            error_message=None,
+            owner=leases.process_id(),
+            heartbeat_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if claimed:
+        leases.start_heartbeat()
+    return bool(claimed)
+
+
+def write_session(session):
+    """Patch the pending edits of a claimed ``session``; see :func:`apply_session`."""
+    edits = session.pending_edits
+    if edits:
+        detach_upload(session.file)
+    by_record = defaultdict(list)
+    for edit in edits:
+        by_record[(edit.record_offset, edit.record_length)].append(edit)
+    locations = sorted(by_record)
+
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], session.file.filename)
+    try:
+        patched = CDRParser().patch_records(
+            filepath,
+            [
+                (
+                    offset,
+                    length,
+                    {e.field: (e.old_number, e.new_number) for e in by_record[offset, length]},
+                )
+                for offset, length in locations
+            ],
+        )
+    except Exception as e:
+        db.session.rollback()
+        session.status = "open"
+        session.error_message = str(e)
+        db.session.commit()
+        raise
+
+    missing = []
+    for location, fields in zip(locations, patched):
+        for edit in by_record[location]:
+            if edit.field not in fields:
+                missing.append(edit)
+            edit.applied = True
+    session.status = "applied"
+    session.applied_at = datetime.utcnow()
+    db.session.commit()
+    return missing
+
+
+def discard_session(session):
+    """Drop the pending edits and restore the numbers they changed."""
+    for edit in session.pending_edits:
+        record = db.session.get(CDRRecord, edit.record_id)
+        if record is not None and getattr(record, edit.field) == edit.new_number:
+            setattr(record, edit.field, edit.old_number)
+        db.session.delete(edit)
+    session.status = "discarded"
+    db.session.commit()
+
+
+def reopen_stale_sessions(*conditions):
+    """Reopen applying sessions matching ``conditions`` whose owner has gone.
+
+    Edits are only marked applied once all of them reached the file, and
+    patching is idempotent, so the reopened session can simply be applied
+    again.
+    """
+    stale = EditSession.query.filter(
+        EditSession.status == "applying", leases.is_stale(EditSession), *conditions
+    ).with_entities(EditSession.id).all()
+    if not stale:
+        return
+    # Conditional, so a session whose owner came back is left alone
+    db.session.execute(
+        db.update(EditSession)
+        .where(
+            EditSession.id.in_([session_id for session_id, in stale]),
+            EditSession.status == "applying",
+            leases.is_stale(EditSession),
+        )
+        .values(
+            status="open",
+            error_message="Interrupted while being applied; apply the session again",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def recover_sessions():
+    """Finish applying sessions whose owning process has gone."""
+    stale = EditSession.query.filter(
+        EditSession.status == "applying", leases.is_stale(EditSession)
+    ).all()
+    for session in stale:
+        if not claim_session(
+            session, EditSession.status == "applying", leases.is_stale(EditSession)
+        ):
+            continue
+        try:
+            write_session(session)
+        except Exception as e:
+            logging.error(f"Could not re-apply edit session {session.id}: {str(e)}")
@@ -0,0 +1,308 @@
+"""Streaming exports of parsed records.
+
+Rows are read through a server-side cursor (``yield_per``) in
+``EXPORT_BATCH_SIZE`` batches and written by generators, so an export starts
+sending immediately and uses the same memory for any number of records.
+"""
+
+import os
+import csv
+import io
+import json
+from datetime import datetime
+
+from app import db
+from models import CDRFile, CDRRecord
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+# Rows per Parquet row group / Arrow record batch in columnar exports
+EXPORT_ROW_GROUP_SIZE = int(os.environ.get("EXPORT_ROW_GROUP_SIZE", "65536"))
+
+# Types available for raw_data fields projected into columnar exports
+PROJECTION_TYPES = ("string", "int64", "float64", "bool", "timestamp")
+
+# CDRRecord columns present in every columnar export, with their types
+COLUMNAR_COLUMNS = [
+    ("record_index", "int64"),
+    ("record_type", "string"),
+    ("calling_number", "string"),
+    ("called_number", "string"),
+    ("call_duration", "int64"),
+    ("start_time", "timestamp"),
+    ("end_time", "timestamp"),
+]
+
+CSV_HEADER = [
+    "Record Index",
+    "Record Type",
+    "Calling Number",
+    "Called Number",
+    "Call Duration (sec)",
+    "Start Time",
+    "End Time",
+]
+
+
+def stream_records(file_id, *columns):
+    """Yield lists of up to ``EXPORT_BATCH_SIZE`` rows in record order.
+
+    With ``columns`` only those columns are selected, otherwise whole
+    :class:`CDRRecord` objects.
+    """
+    if columns:
+        statement = db.select(*columns)
+    else:
+        statement = db.select(CDRRecord)
+    statement = (
+        statement.where(CDRRecord.file_id == file_id)
+        .order_by(CDRRecord.record_index)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    result = db.session.execute(statement)
+    if not columns:
+        result = result.scalars()
+    yield from result.partitions()
+
+
+def record_parser(file_id):
+    """Return the parser shared by all records of an export of ``file_id``.
+
+    Records stored as offsets are decoded again from the upload, and one
+    parser per export keeps its spec and caches across records.
+    """
+    return db.session.get(CDRFile, file_id).record_parser()
+
+
+def iter_csv(file_id):
+    """Yield the CSV export in chunks of ``EXPORT_BATCH_SIZE`` rows."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
+    yield output.getvalue()
+
+    for rows in stream_records(
+        file_id,
+        CDRRecord.record_index,
+        CDRRecord.record_type,
+        CDRRecord.calling_number,
+        CDRRecord.called_number,
+        CDRRecord.call_duration,
+        CDRRecord.start_time,
+        CDRRecord.end_time,
+    ):
+        output.seek(0)
+        output.truncate()
+        for row in rows:
+            writer.writerow(
+                [
+                    row.record_index,
+                    row.record_type or "",
+                    row.calling_number or "",
+                    row.called_number or "",
+                    row.call_duration or "",
+                    row.start_time or "",
+                    row.end_time or "",
+                ]
+            )
+        yield output.getvalue()
+
+
+def iter_json(file_id):
+    """Yield a JSON array of raw records, formatted like ``json.dumps(indent=2)``."""
+    separator = "[\n  "
+    parser = record_parser(file_id)
+    for records in stream_records(file_id):
+        chunk = []
+        for record in records:
+            text = json.dumps(record.get_raw_data(parser), indent=2, default=str)
+            chunk.append(separator + text.replace("\n", "\n  "))
+            separator = ",\n  "
+        yield "".join(chunk)
+    yield "[]" if separator == "[\n  " else "\n]"
+
+
+def iter_ndjson(file_id):
+    """Yield one JSON document per line."""
+    parser = record_parser(file_id)
+    for records in stream_records(file_id):
+        yield "".join(
+            json.dumps(record.get_raw_data(parser), default=str) + "\n"
+            for record in records
+        )
+
+
+def parse_projection(spec):
+    """Parse a projection such as ``imsi=raw_asn1_structure.*.servedIMSI:string``.
+
+    Entries are comma separated ``[name=]path:type``. Path segments are
+    dict keys into the record's raw data and ``*`` matches any key, e.g. the
+    CHOICE alternative of a record. Without ``name`` the column is named
+    after the last path segment. Returns a list of ``(name, path, type)``;
+    raises ``ValueError`` for malformed entries.
+    """
+    fields = []
+    names = {name for name, _ in COLUMNAR_COLUMNS}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        path, _, type_name = entry.rpartition(":")
+        name, _, path = path.rpartition("=")
+        if not path or type_name not in PROJECTION_TYPES:
+            raise ValueError(
+                f"Invalid field {entry!r}; use [name=]path:type with type one of "
+                + ", ".join(PROJECTION_TYPES)
+            )
+        segments = path.split(".")
+        name = name or segments[-1]
+        if name in names:
+            raise ValueError(f"Duplicate column {name!r}; name it with {name}2={path}")
+        names.add(name)
+        fields.append((name, segments, type_name))
+    return fields
+
+
+def lookup_path(data, segments):
+    """Return the value at ``segments`` in nested dicts, or ``None``."""
+    if not segments:
+        return data
+    if not isinstance(data, dict):
+        return None
+    head, rest = segments[0], segments[1:]
+    if head != "*":
+        return lookup_path(data.get(head), rest)
+    for value in data.values():
+        found = lookup_path(value, rest)
+        if found is not None:
+            return found
+    return None
+
+
+def convert_value(value, type_name):
+    """Coerce a raw_data value to a projection type; ``None`` if impossible."""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    try:
+        if type_name == "string":
+            return str(value)
+        if type_name == "int64":
+            return int(value)
+        if type_name == "float64":
+            return float(value)
+        if type_name == "bool":
+            return value if isinstance(value, bool) else str(value).lower() in ("1", "true")
+        if isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class _ChunkSink:
+    """Write-only file object collecting what a pyarrow writer emits."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def record_schema(fields):
+    arrow_types = {
+        "string": pa.string(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us"),
+    }
+    columns = COLUMNAR_COLUMNS + [(name, type_name) for name, _, type_name in fields]
+    return pa.schema([(name, arrow_types[type_name]) for name, type_name in columns])
+
+
+def iter_columnar(file_id, fields, open_writer):
+    """Yield a columnar export, one row group of ``EXPORT_ROW_GROUP_SIZE`` at a time.
+
+    ``open_writer(sink, schema)`` returns a pyarrow writer with
+    ``write_table`` and ``close``.
+    """
+    schema = record_schema(fields)
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+    base_columns = [name for name, _ in COLUMNAR_COLUMNS]
+    columns = {name: [] for name in schema.names}
+
+    def write_group():
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+        return sink.take()
+
+    if fields:
+        parser = record_parser(file_id)
+        batches = stream_records(file_id)
+    else:
+        batches = stream_records(
+            file_id, *(getattr(CDRRecord, name) for name in base_columns)
+        )
+    for rows in batches:
+        for row in rows:
+            for name in base_columns:
+                columns[name].append(getattr(row, name))
+            if fields:
+                raw_data = row.get_raw_data(parser)
+                for name, segments, type_name in fields:
+                    columns[name].append(
+                        convert_value(lookup_path(raw_data, segments), type_name)
+                    )
+        if len(columns["record_index"]) >= EXPORT_ROW_GROUP_SIZE:
+            yield write_group()
+
+    if columns["record_index"]:
+        yield write_group()
+    writer.close()
+    yield sink.take()
+
+
+def iter_parquet(file_id, fields=()):
+    return iter_columnar(file_id, fields, pq.ParquetWriter)
+
+
+def iter_arrow(file_id, fields=()):
+    """Arrow IPC stream format (``pyarrow.ipc.open_stream`` reads it back)."""
+    return iter_columnar(file_id, fields, pa.ipc.new_stream)
+
+
+# format -> (generator, mimetype, file extension)
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv", "csv"),
+    "json": (iter_json, "application/json", "json"),
+    "ndjson": (iter_ndjson, "application/x-ndjson", "ndjson"),
+}
+
+# Formats that need pyarrow and accept a ``fields`` projection
+COLUMNAR_FORMATS = {
+    "parquet": (iter_parquet, "application/vnd.apache.parquet", "parquet"),
+    "arrow": (iter_arrow, "application/vnd.apache.arrow.stream", "arrows"),
+}
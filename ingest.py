@@ -0,0 +1,215 @@
+"""Background ingestion of uploaded CDR files.
+
+Jobs are rows in the ``ingest_job`` table and run on a bounded thread pool.
+Each job parses a file from its ``parse_offset`` to the end and commits
+records in batches, updating ``records_count``, ``parse_offset`` and the job
+progress after every batch, so an interrupted job can simply be restarted.
+Jobs are owned by the process that queued them (see :mod:`leases`). Jobs
+whose owner stopped sending heartbeats are failed on startup and whenever
+the active job of their file is looked up.
+"""
+
+import os
+import logging
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, db
+from models import CDRRecord, IngestJob
+from cdr_parser import CDRParser
+from search import refresh_search_stats
+import leases
+import metrics
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "1000"))
+
+executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+leases.track(IngestJob, ("queued", "running"))
+
+
+def submit_ingest(cdr_file):
+    """Queue a full-file ingest of ``cdr_file`` and return its job."""
+    job = active_job(cdr_file.id)
+    if job is not None:
+        return job
+
+    job = IngestJob(
+        file_id=cdr_file.id,
+        bytes_total=cdr_file.file_size,
+        bytes_start=cdr_file.parse_offset or 0,
+        bytes_processed=cdr_file.parse_offset or 0,
+        owner=leases.process_id(),
+        heartbeat_at=datetime.utcnow(),
+    )
+    cdr_file.parse_status = "processing"
+    db.session.add(job)
+    db.session.commit()
+    leases.start_heartbeat()
+    executor.submit(run_job, job.id)
+    return job
+
+
+def active_job(file_id):
+    """Return the queued or running job of a file, if any.
+
+    A job whose owner has gone is failed first, so a job left behind by a
+    worker that was restarted within the lease does not block the file.
+    """
+    fail_stale_jobs(IngestJob.file_id == file_id)
+    return (
+        IngestJob.query.filter_by(file_id=file_id)
+        .filter(IngestJob.status.in_(("queued", "running")))
+        .order_by(IngestJob.id.desc())
+        .first()
+    )
+
+
+def run_job(job_id):
+    """Parse the remainder of the job's file into the database."""
+    with app.app_context():
+        job = db.session.get(IngestJob, job_id)
+        if job is None:
+            return
+        cdr_file = job.file
+        filepath = os.path.join(app.config["UPLOAD_FOLDER"], cdr_file.filename)
+
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            parser = CDRParser(spec_path=cdr_file.spec_path, top_type="CallDataRecord")
+            # Index record boundaries once for direct seeks later on
+            parser.get_record_index(filepath)
+            start_index = CDRRecord.query.filter_by(file_id=cdr_file.id).count()
+            records = parser.iter_records_parallel(
+                filepath, offset=cdr_file.parse_offset or 0, start_record=start_index
+            )
+
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    store_batch(job, cdr_file, batch, start_index)
+                    start_index += len(batch)
+                    batch = []
+            store_batch(job, cdr_file, batch, start_index)
+
+            if parser.file_metadata:
+                cdr_file.set_file_metadata(parser.file_metadata)
+            cdr_file.parse_status = "success"
+            job.status = "success"
+            job.bytes_processed = job.bytes_total
+            db.session.commit()
+            refresh_search_stats()
+        except Exception as e:
+            logging.error(f"Ingest job {job_id} failed: {str(e)}")
+            db.session.rollback()
+            cdr_file.parse_status = "success" if cdr_file.records_count else "error"
+            cdr_file.error_message = str(e)
+            job.status = "error"
+            job.error_message = str(e)
+
+        cdr_file.recount_record_types()
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def store_batch(job, cdr_file, records, start_index):
+    """Insert one batch of parsed records and record the progress made."""
+    if not records:
+        return
+    insert_records(cdr_file, records, start_index)
+    job.records_processed += len(records)
+    job.bytes_processed = cdr_file.parse_offset
+    job.heartbeat_at = datetime.utcnow()
+    with metrics.timer("db_commit"):
+        db.session.commit()
+
+
+def insert_records(cdr_file, records, start_index, new_offset=None):
+    """Bulk insert parsed records numbered from ``start_index``.
+
+    Rows go through executemany Core inserts of ``INGEST_BATCH_SIZE`` rows,
+    bypassing the ORM unit of work. ``records_count`` and ``parse_offset``
+    of ``cdr_file`` are advanced past the inserted records; ``new_offset``
+    overrides the offset derived from the last record. The caller commits.
+    """
+    if not records:
+        return
+    cdr_file.adjust_record_type_counts(
+        Counter(record.get("record_type", "unknown") for record in records)
+    )
+    table = CDRRecord.__table__
+    for batch_start in range(0, len(records), INGEST_BATCH_SIZE):
+        batch = records[batch_start : batch_start + INGEST_BATCH_SIZE]
+        rows = [
+            record_row(cdr_file.id, start_index + batch_start + i, record)
+            for i, record in enumerate(batch)
+        ]
+        with metrics.timer("db_insert"):
+            db.session.execute(table.insert(), rows)
+    metrics.RECORDS_STORED.inc(len(records))
+
+    if new_offset is None:
+        last = records[-1]
+        new_offset = last["record_offset"] + last["record_length"]
+    cdr_file.records_count = start_index + len(records)
+    cdr_file.parse_offset = new_offset
+
+
+def record_row(file_id, record_index, record):
+    """Column values of the CDRRecord row for one parsed record."""
+    return {
+        "file_id": file_id,
+        "record_index": record_index,
+        "record_type": record.get("record_type", "unknown"),
+        "calling_number": record.get("calling_number"),
+        "called_number": record.get("called_number"),
+        "call_duration": record.get("call_duration"),
+        "start_time": record.get("start_time"),
+        "end_time": record.get("end_time"),
+        "start_epoch": record.get("start_epoch"),
+        "end_epoch": record.get("end_epoch"),
+        "record_offset": record.get("record_offset"),
+        "record_length": record.get("record_length"),
+        **CDRRecord.encode_raw_data(record, in_file=True),
+    }
+
+
+def recover_jobs():
+    """Fail queued or running jobs whose owning process has gone."""
+    fail_stale_jobs()
+
+
+def fail_stale_jobs(*conditions):
+    """Fail queued or running jobs matching ``conditions`` whose owner has gone.
+
+    Each job is failed with a conditional UPDATE, so of several processes
+    finding it at once only one takes it over, and a job whose heartbeat is
+    refreshed in the meantime is left running.
+    """
+    stale = IngestJob.query.filter(
+        IngestJob.status.in_(("queued", "running")), leases.is_stale(IngestJob), *conditions
+    ).all()
+    for job in stale:
+        claimed = db.session.execute(
+            db.update(IngestJob)
+            .where(
+                IngestJob.id == job.id,
+                IngestJob.status.in_(("queued", "running")),
+                leases.is_stale(IngestJob),
+            )
+            .values(
+                status="error",
+                error_message="Interrupted by a restart; start the ingest again to resume",
+                finished_at=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed and job.file.parse_status == "processing":
+            job.file.parse_status = "success" if job.file.records_count else "error"
+        db.session.commit()
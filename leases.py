@@ -0,0 +1,85 @@
+"""Ownership of background work shared through the database.
+
+Ingest jobs (and other rows registered with :func:`track`) record the
+process that runs them in ``owner`` and are kept alive by a heartbeat thread
+that refreshes ``heartbeat_at`` every ``LEASE_SECONDS / 4``. A process
+starting up only takes over rows whose heartbeat is older than
+``LEASE_SECONDS``, so work still running in another worker or instance is
+left alone. Clocks of the hosts sharing a database must agree to well within
+the lease.
+"""
+
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from app import app, db
+
+LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "60"))
+HEARTBEAT_SECONDS = max(LEASE_SECONDS / 4, 1)
+
+# (model, active statuses) of the rows the heartbeat keeps alive
+_tracked = []
+_process = None
+_heartbeat_pid = None
+_lock = threading.Lock()
+
+
+def process_id():
+    """Identifier of this process, unique across hosts and restarts.
+
+    It is regenerated after a fork, so workers forked from a preloaded
+    master do not share their parent's identity.
+    """
+    global _process
+    pid = os.getpid()
+    if _process is None or _process[0] != pid:
+        _process = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}")
+    return _process[1]
+
+
+def track(model, statuses):
+    """Keep rows of ``model`` in ``statuses`` owned by this process alive."""
+    _tracked.append((model, tuple(statuses)))
+
+
+def stale_before():
+    """Rows whose heartbeat is older than this have lost their owner."""
+    return datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+
+
+def is_stale(model):
+    """SQL condition matching rows of ``model`` whose owner has gone."""
+    return db.or_(model.heartbeat_at.is_(None), model.heartbeat_at < stale_before())
+
+
+def start_heartbeat():
+    """Start the heartbeat thread of this process if it is not running."""
+    global _heartbeat_pid
+    with _lock:
+        if _heartbeat_pid == os.getpid():
+            return
+        _heartbeat_pid = os.getpid()
+    threading.Thread(target=_beat, name="lease-heartbeat", daemon=True).start()
+
+
+def _beat():
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        try:
+            with app.app_context():
+                now = datetime.utcnow()
+                owner = process_id()
+                for model, statuses in _tracked:
+                    db.session.execute(
+                        db.update(model)
+                        .where(model.owner == owner, model.status.in_(statuses))
+                        .values(heartbeat_at=now)
+                    )
+                db.session.commit()
+        except Exception as e:
+            logging.warning(f"Lease heartbeat failed: {str(e)}")
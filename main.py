@@ -1,4 +1,7 @@
-from app import app
+# Spawned parse workers import this module as __mp_main__; they only decode
+# records (see cdr_parser._parse_shard) and must not run the app startup
+if __name__ != '__mp_main__':
+    from app import app
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,238 @@
+"""Counters and latency histograms for parsing and ingest.
+
+Metrics are collected when ``METRICS_ENABLED`` is set and rendered in the
+Prometheus text format at ``/metrics``. When disabled, :func:`timer` hands
+out one shared no-op context manager and the ``inc``/``set``/``observe``
+methods return at once, so instrumented hot paths cost a function call.
+
+Each process keeps its own registry. Parse workers send theirs back with the
+records of each shard (see :meth:`Registry.drain`), so sharded parsing is
+counted by the process that started it.
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Upper bounds in seconds, from a single small record to a batch commit
+LATENCY_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005,
+    0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0,
+)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.extend(self.render_sample(labels, value))
+        return lines
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+    def drain(self):
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def merge(self, values):
+        for labels, value in values.items():
+            self.inc(value, *labels)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.values[labels] = value
+
+    def merge(self, values):
+        for labels, value in values.items():
+            self.set(value, *labels)
+
+
+class Histogram(Metric):
+    """Latency histogram; each sample is ``[bucket counts, sum, count]``."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            sample = self.values.get(labels)
+            if sample is None:
+                sample = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            sample[0][bisect_left(self.buckets, value)] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def merge(self, values):
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            for labels, (counts, total, count) in values.items():
+                sample = self.values.get(labels)
+                if sample is None:
+                    sample = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                sample[0] = [a + b for a, b in zip(sample[0], counts)]
+                sample[1] += total
+                sample[2] += count
+
+    def render_sample(self, labels, sample):
+        counts, total, count = sample
+        lines = []
+        cumulative = 0
+        for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket
+            label_text = _format_labels(self.labelnames, labels, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+        lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def drain(self):
+        """Return and reset all samples, for shipping to another process."""
+        if not METRICS_ENABLED:
+            return None
+        return {name: metric.drain() for name, metric in self.metrics.items()}
+
+    def merge(self, samples):
+        """Add samples returned by :meth:`drain` in another process."""
+        if not samples:
+            return
+        for name, values in samples.items():
+            self.metrics[name].merge(values)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "cdr_stage_seconds",
+        "Time spent per record or batch in each parse and ingest stage.",
+        ("stage",),
+    )
+)
+RECORDS_PARSED = REGISTRY.register(
+    Counter("cdr_records_parsed_total", "Records decoded from CDR files.")
+)
+BYTES_PARSED = REGISTRY.register(
+    Counter("cdr_bytes_parsed_total", "Bytes of records decoded from CDR files.")
+)
+BYTES_SKIPPED = REGISTRY.register(
+    Counter(
+        "cdr_bytes_skipped_total",
+        "Bytes passed over without decoding: filler between records or bytes after a decode failure.",
+        ("reason",),
+    )
+)
+DECODE_FAILURES = REGISTRY.register(
+    Counter("cdr_decode_failures_total", "Records or regions that could not be decoded.", ("decoder",))
+)
+LAST_FAILURE_OFFSET = REGISTRY.register(
+    Gauge(
+        "cdr_decode_failure_offset_bytes",
+        "File offset of the most recent decode failure.",
+        ("decoder",),
+    )
+)
+RECORDS_STORED = REGISTRY.register(
+    Counter("cdr_records_stored_total", "Parsed records inserted into the database.")
+)
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+_DISABLED_TIMER = nullcontext()
+
+
+def timer(stage):
+    """Context manager adding the time of its block to ``stage``."""
+    if METRICS_ENABLED:
+        return _StageTimer(stage)
+    return _DISABLED_TIMER
+
+
+def record_decode_failure(decoder, offset, skipped=0):
+    """Count a decode failure at ``offset`` and the bytes left undecoded."""
+    DECODE_FAILURES.inc(1, decoder)
+    LAST_FAILURE_OFFSET.set(offset, decoder)
+    if skipped:
+        BYTES_SKIPPED.inc(skipped, "undecodable")
@@ -1,6 +1,18 @@
 from app import db
 from datetime import datetime
+from flask import current_app
+import os
 import json
+import zlib
+
+import metrics
+
+# How parsed records are kept in CDRRecord: "compressed" (zlib of compact
+# JSON), "offset" (only the record's position, re-decoded from the file on
+# read) or "json" (pretty-printed text, the original format)
+RAW_DATA_STORAGE = os.environ.get("RAW_DATA_STORAGE", "compressed")
+
+UNIX_EPOCH = datetime(1970, 1, 1)
 
 class CDRFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -13,10 +25,101 @@ class CDRFile(db.Model):
     records_count = db.Column(db.Integer, default=0)
     parse_offset = db.Column(db.Integer, default=0)
     spec_path = db.Column(db.String(255))
+    file_metadata = db.Column(db.Text)  # JSON header/trailer of container files
+    record_type_counts = db.Column(db.Text)  # JSON {record_type: count}, kept up to date on writes
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the stored upload, cleared once edited
     # Relationship to parsed records
     records = db.relationship('CDRRecord', backref='file', lazy=True, cascade='all, delete-orphan')
+    jobs = db.relationship('IngestJob', backref='file', lazy=True, cascade='all, delete-orphan')
+    edit_sessions = db.relationship('EditSession', backref='file', lazy=True, cascade='all, delete-orphan')
+
+    def record_parser(self):
+        """Return a parser decoding single records of this file"""
+        from cdr_parser import CDRParser
+
+        return CDRParser(spec_path=self.spec_path, top_type='CallDataRecord')
+
+    def get_file_metadata(self):
+        """Return the container header/trailer as a Python object"""
+        if self.file_metadata:
+            try:
+                return json.loads(self.file_metadata)
+            except json.JSONDecodeError:
+                return {}
+        return {}
+
+    def set_file_metadata(self, data):
+        """Set the container header/trailer from a Python object"""
+        self.file_metadata = json.dumps(data, default=str)
+
+    def get_record_type_counts(self):
+        """Return the number of records of each type.
+
+        Counts are maintained as records are written; files parsed before
+        they existed are counted once here and the result is stored.
+        """
+        if self.record_type_counts is None:
+            self.record_type_counts = json.dumps(self.count_record_types())
+            db.session.commit()
+        return json.loads(self.record_type_counts)
+
+    def count_record_types(self):
+        """Count the records of each type with a GROUP BY"""
+        rows = (
+            db.session.query(CDRRecord.record_type, db.func.count(CDRRecord.id))
+            .filter_by(file_id=self.id)
+            .group_by(CDRRecord.record_type)
+            .all()
+        )
+        return {record_type or 'unknown': count for record_type, count in rows}
+
+    def recount_record_types(self):
+        """Replace the stored counts with a fresh GROUP BY count.
+
+        Databases without row locks (SQLite) can lose a concurrent
+        adjustment, so bulk writers recount when they finish.
+        """
+        db.session.query(CDRFile.id).filter_by(id=self.id).with_for_update().scalar()
+        self.record_type_counts = json.dumps(self.count_record_types())
+
+    def adjust_record_type_counts(self, changes):
+        """Add ``{record_type: delta}`` to the stored counts.
+
+        Call this before writing the records so that files without stored
+        counts are counted without the pending changes. The stored counts are
+        re-read under a row lock, since ingest threads and requests adjust
+        the counts of the same file concurrently.
+        """
+        stored = self.record_type_counts
+        if self.id is not None:
+            stored = (
+                db.session.query(CDRFile.record_type_counts)
+                .filter_by(id=self.id)
+                .with_for_update()
+                .scalar()
+            )
+        if stored is not None:
+            counts = json.loads(stored)
+        elif self.id is not None:
+            counts = self.count_record_types()
+        else:
+            counts = {}
+        for record_type, delta in changes.items():
+            record_type = record_type or 'unknown'
+            counts[record_type] = counts.get(record_type, 0) + delta
+            if counts[record_type] <= 0:
+                del counts[record_type]
+        self.record_type_counts = json.dumps(counts)
+
 
 class CDRRecord(db.Model):
+    __table_args__ = (
+        db.Index('ix_cdr_record_file_index', 'file_id', 'record_index'),
+        db.Index('ix_cdr_record_file_type', 'file_id', 'record_type'),
+        db.Index('ix_cdr_record_file_start', 'file_id', 'start_epoch'),
+        db.Index('ix_cdr_record_file_end', 'file_id', 'end_epoch'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     file_id = db.Column(db.Integer, db.ForeignKey('cdr_file.id'), nullable=False)
     record_index = db.Column(db.Integer, nullable=False)
@@ -26,17 +129,178 @@ class CDRRecord(db.Model):
     call_duration = db.Column(db.Integer)  # in seconds
     start_time = db.Column(db.DateTime)
     end_time = db.Column(db.DateTime)
+    start_epoch = db.Column(db.BigInteger)  # start_time in seconds since 1970 UTC
+    end_epoch = db.Column(db.BigInteger)
     raw_data = db.Column(db.Text)  # JSON string of the complete parsed record
-    
-    def get_raw_data(self):
-        """Return the raw data as a Python object"""
+    raw_data_z = db.Column(db.LargeBinary)  # zlib-compressed compact JSON
+    record_offset = db.Column(db.Integer)  # position of the record in the file
+    record_length = db.Column(db.Integer)
+
+    def utc_offset(self):
+        """Seconds the local start/end times are ahead of UTC.
+
+        Derived from a time stored with its epoch; 0 when there is none.
+        """
+        for local, epoch in ((self.start_time, self.start_epoch), (self.end_time, self.end_epoch)):
+            if local is not None and epoch is not None:
+                return int((local - UNIX_EPOCH).total_seconds()) - epoch
+        return 0
+
+    def update_epochs(self, utc_offset=0):
+        """Set start_epoch and end_epoch from the local start/end times"""
+        self.start_epoch = (
+            None if self.start_time is None
+            else int((self.start_time - UNIX_EPOCH).total_seconds()) - utc_offset
+        )
+        self.end_epoch = (
+            None if self.end_time is None
+            else int((self.end_time - UNIX_EPOCH).total_seconds()) - utc_offset
+        )
+
+    def get_raw_data(self, parser=None):
+        """Return the raw data as a Python object
+
+        ``parser`` decodes records stored as offsets; pass the one returned
+        by :meth:`CDRFile.record_parser` when reading many records of a file.
+        """
+        if self.raw_data_z is not None:
+            return json.loads(zlib.decompress(self.raw_data_z))
         if self.raw_data:
             try:
                 return json.loads(self.raw_data)
             except json.JSONDecodeError:
                 return {}
+        if self.record_offset is not None and self.record_length:
+            return self.decode_from_file(parser)
         return {}
-    
+
+    def get_raw_data_json(self):
+        """Return the raw data as indented JSON text for editing"""
+        data = self.get_raw_data()
+        return json.dumps(data, default=str, indent=2) if data else ''
+
     def set_raw_data(self, data):
         """Set the raw data from a Python object"""
-        self.raw_data = json.dumps(data, default=str, indent=2)
+        for column, value in self.encode_raw_data(data).items():
+            setattr(self, column, value)
+
+    @staticmethod
+    def encode_raw_data(data, in_file=False):
+        """Return the raw data column values for a record.
+
+        ``in_file`` marks a record decoded unchanged from its file. The
+        "offset" storage mode re-decodes such records instead of storing
+        them when the parser decoded them from a whole record element
+        (``whole_element``); fallback records are stored like any other.
+        """
+        columns = {'raw_data': None, 'raw_data_z': None}
+        with metrics.timer('serialize'):
+            if RAW_DATA_STORAGE == 'json':
+                columns['raw_data'] = json.dumps(data, default=str, indent=2)
+            elif not (RAW_DATA_STORAGE == 'offset' and in_file and data.get('whole_element')):
+                text = json.dumps(data, default=str, separators=(',', ':'))
+                columns['raw_data_z'] = zlib.compress(text.encode('utf-8'))
+        return columns
+
+    def binary_location(self):
+        """Return ``(filepath, offset, length)`` of the record's bytes, or None"""
+        from cdr_parser import CDRParser
+
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], self.file.filename)
+        if self.record_offset is not None and self.record_length:
+            return filepath, self.record_offset, self.record_length
+        # Records stored before offsets were kept are found through the index
+        if not os.path.exists(filepath):
+            return None
+        index = CDRParser().get_record_index(filepath)
+        if index is None or not 0 <= self.record_index < len(index):
+            return None
+        entry = index.entry(self.record_index)
+        return filepath, entry.offset, entry.length
+
+    def decode_from_file(self, parser=None):
+        """Re-decode the record from its position in the uploaded file"""
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], self.file.filename)
+        try:
+            if parser is None:
+                parser = self.file.record_parser()
+            return parser.decode_record_at(
+                filepath, self.record_offset, self.record_length, self.record_index
+            )
+        except (OSError, ValueError):
+            return {}
+
+class IngestJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('cdr_file.id'), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # queued, running, success, error
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    bytes_total = db.Column(db.Integer, default=0)
+    bytes_start = db.Column(db.Integer, default=0)  # parse_offset when the job started
+    bytes_processed = db.Column(db.Integer, default=0)
+    records_processed = db.Column(db.Integer, default=0)
+    error_message = db.Column(db.Text)
+    owner = db.Column(db.String(100))  # leases.process_id() of the process running the job
+    heartbeat_at = db.Column(db.DateTime)  # last sign of life of the owner
+
+    @property
+    def is_active(self):
+        return self.status in ('queued', 'running')
+
+    def get_progress(self):
+        """Return the job state with throughput and ETA as a dict"""
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        bytes_done = (self.bytes_processed or 0) - (self.bytes_start or 0)
+        bytes_per_second = bytes_done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.status == 'running' and bytes_per_second > 0:
+            eta = max(self.bytes_total - self.bytes_processed, 0) / bytes_per_second
+        return {
+            'job_id': self.id,
+            'file_id': self.file_id,
+            'status': self.status,
+            'bytes_total': self.bytes_total,
+            'bytes_processed': self.bytes_processed,
+            'percent': round(100.0 * self.bytes_processed / self.bytes_total, 1) if self.bytes_total else 0.0,
+            'records_processed': self.records_processed,
+            'records_per_second': round(self.records_processed / elapsed, 1) if elapsed > 0 else 0.0,
+            'bytes_per_second': round(bytes_per_second, 1),
+            'elapsed_seconds': round(elapsed, 1),
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'error_message': self.error_message,
+        }
+
+
+class EditSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('cdr_file.id'), nullable=False)
+    status = db.Column(db.String(20), default='open')  # open, applying, applied, discarded
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime)
+    error_message = db.Column(db.Text)
+    owner = db.Column(db.String(100))  # leases.process_id() of the process applying it
+    heartbeat_at = db.Column(db.DateTime)
+    edits = db.relationship('PendingEdit', backref='session', lazy=True,
+                            cascade='all, delete-orphan', order_by='PendingEdit.record_offset')
+
+    @property
+    def pending_edits(self):
+        return [edit for edit in self.edits if not edit.applied]
+
+
+class PendingEdit(db.Model):
+    """One number change journaled for a record, not yet written to the file"""
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('edit_session.id'), nullable=False)
+    # Not a foreign key: the bytes stay in the file if the record row is deleted
+    record_id = db.Column(db.Integer, nullable=False)
+    field = db.Column(db.String(20), nullable=False)  # calling_number or called_number
+    old_number = db.Column(db.String(50), nullable=False)  # number currently in the file
+    new_number = db.Column(db.String(50), nullable=False)
+    record_offset = db.Column(db.Integer, nullable=False)
+    record_length = db.Column(db.Integer, nullable=False)
+    applied = db.Column(db.Boolean, default=False)
@@ -0,0 +1,112 @@
+"""Keyset pagination of CDR records.
+
+Pages are located by the ``(record_index, id)`` of their first or last row
+instead of an ``OFFSET``, so every page is an index seek on ``(file_id,
+record_index)`` no matter how deep it is. ``record_index`` alone is not
+unique: rows added after a record was deleted reuse the indexes after it.
+"""
+
+from app import db
+from models import CDRRecord
+
+# Searches are counted up to this many matches and shown as "N+" beyond it
+SEARCH_COUNT_LIMIT = 10000
+
+
+def parse_cursor(value):
+    """Parse a ``"<record_index>_<id>"`` page cursor.
+
+    A bare record index is accepted too, as in links made before the id was
+    added. Returns ``(record_index, id)`` with ``id`` possibly ``None``, or
+    ``None`` when ``value`` is empty or malformed.
+    """
+    if not value:
+        return None
+    record_index, _, row_id = value.partition("_")
+    try:
+        return int(record_index), int(row_id) if row_id else None
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    """One page of ``query`` ordered by ``(record_index, id)``.
+
+    ``after`` selects the page following that cursor and ``before`` the page
+    preceding it, both as returned by :func:`parse_cursor`; with neither the
+    first page is returned. ``next_after`` and ``prev_before`` are the
+    cursors of the neighbouring pages.
+    """
+
+    def __init__(self, query, per_page, after=None, before=None):
+        self.per_page = per_page
+        if before is not None:
+            rows = (
+                query.filter(self._before(before))
+                .order_by(CDRRecord.record_index.desc(), CDRRecord.id.desc())
+                .limit(per_page + 1)
+                .all()
+            )
+            self.has_prev = len(rows) > per_page
+            self.items = list(reversed(rows[:per_page]))
+            self.has_next = (
+                self._exists(query, self._after(self._key(self.items[-1])))
+                if self.items
+                else False
+            )
+        else:
+            if after is not None:
+                query_page = query.filter(self._after(after))
+            else:
+                query_page = query
+            rows = (
+                query_page.order_by(CDRRecord.record_index, CDRRecord.id)
+                .limit(per_page + 1)
+                .all()
+            )
+            self.has_next = len(rows) > per_page
+            self.items = rows[:per_page]
+            self.has_prev = (
+                after is not None
+                and bool(self.items)
+                and self._exists(query, self._before(self._key(self.items[0])))
+            )
+
+        self.next_after = self._cursor(self.items[-1]) if self.items else None
+        self.prev_before = self._cursor(self.items[0]) if self.items else None
+
+    @staticmethod
+    def _key(record):
+        return record.record_index, record.id
+
+    @staticmethod
+    def _cursor(record):
+        return f"{record.record_index}_{record.id}"
+
+    @staticmethod
+    def _after(cursor):
+        record_index, row_id = cursor
+        if row_id is None:
+            return CDRRecord.record_index > record_index
+        return db.tuple_(CDRRecord.record_index, CDRRecord.id) > (record_index, row_id)
+
+    @staticmethod
+    def _before(cursor):
+        record_index, row_id = cursor
+        if row_id is None:
+            return CDRRecord.record_index < record_index
+        return db.tuple_(CDRRecord.record_index, CDRRecord.id) < (record_index, row_id)
+
+    @staticmethod
+    def _exists(query, condition):
+        return query.filter(condition).with_entities(CDRRecord.id).first() is not None
+
+
+def bounded_count(query, limit=SEARCH_COUNT_LIMIT):
+    """Count the rows of ``query`` up to ``limit``.
+
+    Returns ``(count, is_estimate)``; ``is_estimate`` is true when there are
+    more than ``limit`` rows.
+    """
+    count = query.with_entities(CDRRecord.id).limit(limit + 1).count()
+    return min(count, limit), count > limit
@@ -10,14 +10,25 @@ from flask import (
     flash,
     jsonify,
     Response,
+    stream_with_context,
 )
 from werkzeug.utils import secure_filename
 from app import app, db
-from models import CDRFile, CDRRecord
-from cdr_parser import CDRParser
-import shutil
-import csv
-import io
+from models import CDRFile, CDRRecord, IngestJob, EditSession
+from cdr_parser import CDRParser, FIELD_MAPPING
+from ingest import submit_ingest, active_job, insert_records
+from edit_sessions import (
+    open_session,
+    active_session,
+    journal_edit,
+    apply_session,
+    discard_session,
+)
+from storage import save_upload, find_parsed_upload, detach_upload, release_upload
+from search import number_filter
+from pagination import KeysetPage, bounded_count, parse_cursor
+from exports import EXPORT_FORMATS, COLUMNAR_FORMATS, parse_projection, pa
+import metrics
 
 ALLOWED_EXTENSIONS = {"dat", "cdr", "bin", "asn1", "ber", "der"}
 
@@ -49,22 +60,25 @@ def upload_file():
 
         if file and allowed_file(file.filename):
             try:
-                # Secure the filename
                 original_filename = file.filename
-                filename = secure_filename(file.filename)
 
-                # Save the file
-                filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-                file.save(filepath)
+                # Save the file and spec under the hash of their content
+                filename, digest, file_size = save_upload(file)
 
                 spec_path = None
                 if spec_file and spec_file.filename:
-                    spec_name = secure_filename(spec_file.filename)
+                    spec_name, _, _ = save_upload(spec_file)
                     spec_path = os.path.join(app.config["UPLOAD_FOLDER"], spec_name)
-                    spec_file.save(spec_path)
 
-                # Get file size
-                file_size = os.path.getsize(filepath)
+                # Identical bytes parsed with the same spec: reuse the records
+                existing = find_parsed_upload(digest, spec_path)
+                if existing is not None:
+                    flash(
+                        "Identical file already uploaded as "
+                        f"{existing.original_filename}; showing its records.",
+                        "info",
+                    )
+                    return redirect(url_for("view_results", file_id=existing.id))
 
                 # Create database record
                 cdr_file = CDRFile(
@@ -72,52 +86,19 @@ def upload_file():
                     original_filename=original_filename,
                     file_size=file_size,
                     spec_path=spec_path,
+                    content_hash=digest,
                 )
                 db.session.add(cdr_file)
                 db.session.commit()
 
-                # Parse the first chunk of the file for faster feedback
-                parser = CDRParser(spec_path=spec_path, top_type="CallDataRecord")
-                try:
-                    records, reached_end, new_offset = parser.parse_file_chunk(
-                        filepath,
-                        max_records=1000,
+                # Index and parse the whole file in the background
+                job = submit_ingest(cdr_file)
 
-                    )
-
-                    # Save parsed records to database
-                    for i, record in enumerate(records):
-                        cdr_record = CDRRecord(
-                            file_id=cdr_file.id,
-                            record_index=i,
-                            record_type=record.get("record_type", "unknown"),
-                            calling_number=record.get("calling_number"),
-                            called_number=record.get("called_number"),
-                            call_duration=record.get("call_duration"),
-                            start_time=record.get("start_time"),
-                            end_time=record.get("end_time"),
-                        )
-                        cdr_record.set_raw_data(record)
-                        db.session.add(cdr_record)
-
-                    cdr_file.records_count = len(records)
-                    cdr_file.parse_status = "success"
-                    cdr_file.parse_offset = new_offset
-                    db.session.commit()
-
-                    flash(
-                        f"File uploaded. Parsed {len(records)} records.",
-                        "success",
-                    )
-                    return redirect(url_for("view_results", file_id=cdr_file.id))
-
-                except Exception as e:
-                    logging.error(f"Error parsing file {filename}: {str(e)}")
-                    cdr_file.parse_status = "error"
-                    cdr_file.error_message = str(e)
-                    db.session.commit()
-                    flash(f"Error parsing file: {str(e)}", "error")
-                    return redirect(url_for("view_results", file_id=cdr_file.id))
+                flash(
+                    f"File uploaded. Parsing records in the background (job {job.id}).",
+                    "success",
+                )
+                return redirect(url_for("view_results", file_id=cdr_file.id))
 
             except Exception as e:
                 logging.error(f"Error uploading file: {str(e)}")
@@ -137,122 +118,189 @@ def upload_file():
 def view_results(file_id):
     cdr_file = CDRFile.query.get_or_404(file_id)
 
-    # Get pagination parameters
-    page = request.args.get("page", 1, type=int)
+    # Keyset cursors: the page after or before a (record index, id)
     per_page = 50
+    after = parse_cursor(request.args.get("after"))
+    before = parse_cursor(request.args.get("before"))
 
     # Get search parameters
     search_query = request.args.get("search", "")
     record_type_filter = request.args.get("record_type", "")
+    # Start time range as seconds since 1970 UTC
+    since = request.args.get("since", type=int)
+    until = request.args.get("until", type=int)
 
     # Build query with filters
     query = CDRRecord.query.filter_by(file_id=file_id)
 
     if search_query:
-        query = query.filter(
-            db.or_(
-                CDRRecord.calling_number.contains(search_query),
-                CDRRecord.called_number.contains(search_query),
-            )
-        )
+        query = query.filter(number_filter(search_query))
 
     if record_type_filter:
         query = query.filter(CDRRecord.record_type == record_type_filter)
 
-    # Get paginated results
-    records = query.paginate(page=page, per_page=per_page, error_out=False)
-
-    # Get unique record types for filter
-    record_types = (
-        db.session.query(CDRRecord.record_type)
-        .filter_by(file_id=file_id)
-        .distinct()
-        .all()
-    )
-    record_types = [rt[0] for rt in record_types if rt[0]]
+    if since is not None:
+        query = query.filter(CDRRecord.start_epoch >= since)
+    if until is not None:
+        query = query.filter(CDRRecord.start_epoch < until)
+    time_filtered = since is not None or until is not None
+
+    records = KeysetPage(query, per_page, after=after, before=before)
+
+    # Record types and totals come from counts maintained on write
+    record_type_counts = cdr_file.get_record_type_counts()
+    total_is_estimate = False
+    if search_query or time_filtered:
+        total, total_is_estimate = bounded_count(query)
+    elif record_type_filter:
+        total = record_type_counts.get(record_type_filter, 0)
+    else:
+        total = sum(record_type_counts.values())
 
     return render_template(
         "results.html",
         cdr_file=cdr_file,
         records=records,
-        record_types=record_types,
+        total=total,
+        total_is_estimate=total_is_estimate,
+        record_type_counts=record_type_counts,
         search_query=search_query,
         record_type_filter=record_type_filter,
+        since=since,
+        until=until,
+        job=active_job(file_id),
+        edit_session=active_session(file_id),
     )
 
 
-@app.route("/export/<int:file_id>/<format>")
-def export_data(file_id, format):
+@app.route("/ingest/<int:file_id>", methods=["POST"])
+def ingest_file(file_id):
+    """Parse all remaining records of a file in the background."""
     cdr_file = CDRFile.query.get_or_404(file_id)
-    records = CDRRecord.query.filter_by(file_id=file_id).all()
-
-    if format == "json":
-        # Export as JSON
-        data = []
-        for record in records:
-            data.append(record.get_raw_data())
-
-        response = Response(
-            json.dumps(data, indent=2, default=str),
-            mimetype="application/json",
-            headers={
-                "Content-Disposition": f"attachment; filename={cdr_file.original_filename}.json"
-            },
-        )
-        return response
-
-    elif format == "csv":
-        # Export as CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write header
-        writer.writerow(
-            [
-                "Record Index",
-                "Record Type",
-                "Calling Number",
-                "Called Number",
-                "Call Duration (sec)",
-                "Start Time",
-                "End Time",
-            ]
-        )
+    job = submit_ingest(cdr_file)
+    flash(f"Parsing remaining records in the background (job {job.id})", "info")
+    return redirect(url_for("view_results", file_id=file_id))
 
-        # Write data
-        for record in records:
-            writer.writerow(
-                [
-                    record.record_index,
-                    record.record_type or "",
-                    record.calling_number or "",
-                    record.called_number or "",
-                    record.call_duration or "",
-                    record.start_time or "",
-                    record.end_time or "",
-                ]
+
+@app.route("/edit_session/<int:file_id>", methods=["POST"])
+def start_edit_session(file_id):
+    """Collect number edits of a file and write them back in one pass."""
+    cdr_file = CDRFile.query.get_or_404(file_id)
+    open_session(cdr_file)
+    flash("Edit session started; edits are written to the file when applied", "info")
+    return redirect(url_for("view_results", file_id=file_id))
+
+
+@app.route("/edit_session/<int:session_id>/apply", methods=["POST"])
+def apply_edit_session(session_id):
+    session = EditSession.query.get_or_404(session_id)
+    file_id = session.file_id
+    if session.status != "open":
+        flash("Edit session is not open", "error")
+        return redirect(url_for("view_results", file_id=file_id))
+
+    try:
+        count = len(session.pending_edits)
+        missing = apply_session(session)
+        if missing:
+            flash(
+                f"Applied {count - len(missing)} of {count} edits; number(s) with "
+                "no mapped field in the binary records were only changed in the "
+                "database: "
+                + ", ".join(edit.old_number for edit in missing),
+                "error",
             )
+        else:
+            flash(f"Applied {count} edits to the file", "success")
+    except Exception as e:
+        logging.error(f"Error applying edit session: {str(e)}")
+        flash(f"Error applying edit session: {str(e)}", "error")
 
-        output.seek(0)
-        response = Response(
-            output.getvalue(),
-            mimetype="text/csv",
-            headers={
-                "Content-Disposition": f"attachment; filename={cdr_file.original_filename}.csv"
-            },
+    return redirect(url_for("view_results", file_id=file_id))
+
+
+@app.route("/edit_session/<int:session_id>/discard", methods=["POST"])
+def discard_edit_session(session_id):
+    session = EditSession.query.get_or_404(session_id)
+    if session.status == "open":
+        discard_session(session)
+        flash("Pending edits discarded", "success")
+    return redirect(url_for("view_results", file_id=session.file_id))
+
+
+@app.route("/jobs/<int:job_id>")
+def job_progress(job_id):
+    """Report the progress of an ingest job as JSON."""
+    job = IngestJob.query.get_or_404(job_id)
+    return jsonify({"success": True, "job": job.get_progress()})
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Parse and ingest metrics in the Prometheus text format."""
+    if not metrics.METRICS_ENABLED:
+        return Response(
+            "Metrics are disabled; set METRICS_ENABLED=1\n",
+            status=404,
+            mimetype="text/plain",
         )
-        return response
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/export/<int:file_id>/<format>")
+def export_data(file_id, format):
+    cdr_file = CDRFile.query.get_or_404(file_id)
 
+    if format in COLUMNAR_FORMATS:
+        if pa is None:
+            flash("Columnar export requires pyarrow", "error")
+            return redirect(url_for("view_results", file_id=file_id))
+        try:
+            fields = parse_projection(request.args.get("fields", ""))
+        except ValueError as e:
+            flash(str(e), "error")
+            return redirect(url_for("view_results", file_id=file_id))
+        generate, mimetype, extension = COLUMNAR_FORMATS[format]
+        stream = generate(file_id, fields)
+    elif format in EXPORT_FORMATS:
+        generate, mimetype, extension = EXPORT_FORMATS[format]
+        stream = generate(file_id)
     else:
         flash("Invalid export format", "error")
         return redirect(url_for("view_results", file_id=file_id))
 
+    # Stream the export while rows are read in batches
+    return Response(
+        stream_with_context(stream),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={cdr_file.original_filename}.{extension}"
+        },
+    )
+
 
 @app.route("/record/<int:record_id>")
 def view_record_details(record_id):
     record = CDRRecord.query.get_or_404(record_id)
     raw_data = record.get_raw_data()
 
+    # Locate the record in the binary file through the sidecar index
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], record.file.filename)
+    binary = None
+    if os.path.exists(filepath):
+        parser = CDRParser()
+        index = parser.get_record_index(filepath)
+        if index is not None and record.record_index < len(index):
+            entry = index.entry(record.record_index)
+            binary = {
+                "offset": entry.offset,
+                "length": entry.length,
+                "tag": entry.tag_number,
+                "alternative": entry.alternative,
+            }
+            if not raw_data:
+                raw_data = parser.read_record(filepath, record.record_index) or {}
+
     return jsonify(
         {
             "success": True,
@@ -264,7 +312,10 @@ def view_record_details(record_id):
                 "call_duration": record.call_duration,
                 "start_time": str(record.start_time) if record.start_time else None,
                 "end_time": str(record.end_time) if record.end_time else None,
+                "start_epoch": record.start_epoch,
+                "end_epoch": record.end_epoch,
                 "raw_data": raw_data,
+                "binary": binary,
             },
         }
     )
@@ -274,7 +325,12 @@ def view_record_details(record_id):
 def edit_record(record_id):
     record = CDRRecord.query.get_or_404(record_id)
     cdr_file = record.file
-    return render_template("edit_record.html", record=record, cdr_file=cdr_file)
+    return render_template(
+        "edit_record.html",
+        record=record,
+        cdr_file=cdr_file,
+        numbers_patchable=record.record_type in FIELD_MAPPING.mapped_record_types,
+    )
 
 
 @app.route("/edit/<int:record_id>", methods=["POST"])
@@ -282,8 +338,23 @@ def update_record(record_id):
     record = CDRRecord.query.get_or_404(record_id)
 
     try:
+        session = active_session(record.file_id)
+        if session is None or session.status != "open":
+            # Numbers are patched into the file: stop sharing it first
+            if any(
+                (request.form.get(field, "").strip() or None) != getattr(record, field)
+                for field in ("calling_number", "called_number")
+            ):
+                detach_upload(record.file)
+
         # Update basic fields
-        record.record_type = request.form.get("record_type", "").strip()
+        record_type = request.form.get("record_type", "").strip()
+        if record_type != record.record_type:
+            record.file.adjust_record_type_counts(
+                {record.record_type: -1, record_type: 1}
+            )
+        record.record_type = record_type
+        old_numbers = (record.calling_number, record.called_number)
         record.calling_number = request.form.get("calling_number", "").strip() or None
         record.called_number = request.form.get("called_number", "").strip() or None
 
@@ -297,7 +368,8 @@ def update_record(record_id):
         else:
             record.call_duration = None
 
-        # Update timestamps
+        # Update timestamps, keeping the UTC offset they were parsed with
+        utc_offset = record.utc_offset()
         start_time_str = request.form.get("start_time", "").strip()
         if start_time_str:
             try:
@@ -317,6 +389,7 @@ def update_record(record_id):
                 record.end_time = None
         else:
             record.end_time = None
+        record.update_epochs(utc_offset)
 
         # Update raw data if provided
         raw_data_str = request.form.get("raw_data", "").strip()
@@ -328,27 +401,35 @@ def update_record(record_id):
                 flash("Invalid JSON format in raw data field", "error")
                 return redirect(url_for("edit_record", record_id=record_id))
 
-        db.session.commit()
-
-        # Persist edited numbers back to the uploaded file
-        cdr_file = record.file
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], cdr_file.filename)
-        parser = CDRParser(spec_path=cdr_file.spec_path, top_type="CallDataRecord")
-        all_records = (
-            CDRRecord.query.filter_by(file_id=cdr_file.id)
-            .order_by(CDRRecord.record_index)
-            .all()
-        )
-        records_data = []
-        for r in all_records:
-            data = r.get_raw_data()
-            if "calling_number" not in data:
-                data["calling_number"] = r.calling_number
-            records_data.append(data)
+        # Patch edited numbers into the record's bytes in the uploaded file
+        changes = {
+            field: (old, getattr(record, field))
+            for field, old in zip(("calling_number", "called_number"), old_numbers)
+            if old and getattr(record, field) and old != getattr(record, field)
+        }
+        missing = []
+        if session is not None and session.status == "open":
+            # Journaled now, written with the rest of the session
+            for field, old in zip(("calling_number", "called_number"), old_numbers):
+                if not journal_edit(session, record, field, old, getattr(record, field)):
+                    missing.append(old)
+        else:
+            location = record.binary_location() if changes else None
+            if location is not None:
+                patched = CDRParser().patch_record_numbers(*location, changes)
+                missing = [changes[field][0] for field in changes if field not in patched]
 
-        parser.save_records_to_file(filepath, records_data)
+        db.session.commit()
 
-        flash("Record updated successfully", "success")
+        if missing:
+            flash(
+                "Record updated; number(s) have no mapped field in the binary "
+                "record (e.g. record types without a field mapping), so only "
+                "the database was changed: " + ", ".join(missing),
+                "error",
+            )
+        else:
+            flash("Record updated successfully", "success")
         return redirect(url_for("view_results", file_id=record.file_id))
 
     except Exception as e:
@@ -377,10 +458,12 @@ def create_record(file_id):
         next_index = (max_index or -1) + 1
 
         # Create new record
+        record_type = request.form.get("record_type", "").strip() or "manual"
+        cdr_file.adjust_record_type_counts({record_type: 1})
         record = CDRRecord(
             file_id=file_id,
             record_index=next_index,
-            record_type=request.form.get("record_type", "").strip() or "manual",
+            record_type=record_type,
             calling_number=request.form.get("calling_number", "").strip() or None,
             called_number=request.form.get("called_number", "").strip() or None,
         )
@@ -409,6 +492,7 @@ def create_record(file_id):
                 record.end_time = datetime.strptime(end_time_str, "%Y-%m-%d %H:%M:%S")
             except ValueError:
                 pass
+        record.update_epochs()
 
         # Set raw data
         raw_data_str = request.form.get("raw_data", "").strip()
@@ -427,22 +511,6 @@ def create_record(file_id):
 
         db.session.commit()
 
-        # Persist new records back to the uploaded file
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], cdr_file.filename)
-        parser = CDRParser(spec_path=cdr_file.spec_path, top_type="CallDataRecord")
-        all_records = (
-            CDRRecord.query.filter_by(file_id=cdr_file.id)
-            .order_by(CDRRecord.record_index)
-            .all()
-        )
-        records_data = []
-        for r in all_records:
-            data = r.get_raw_data()
-            if "calling_number" not in data:
-                data["calling_number"] = r.calling_number
-            records_data.append(data)
-        parser.save_records_to_file(filepath, records_data)
-
         flash("Record created successfully", "success")
         return redirect(url_for("view_results", file_id=file_id))
 
@@ -458,6 +526,7 @@ def delete_record(record_id):
     file_id = record.file_id
 
     try:
+        record.file.adjust_record_type_counts({record.record_type: -1})
         db.session.delete(record)
 
         # Update file record count
@@ -466,23 +535,6 @@ def delete_record(record_id):
 
         db.session.commit()
 
-        # Persist deletion to the file
-        cdr_file = CDRFile.query.get(file_id)
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], cdr_file.filename)
-        parser = CDRParser(spec_path=cdr_file.spec_path, top_type="CallDataRecord")
-        all_records = (
-            CDRRecord.query.filter_by(file_id=file_id)
-            .order_by(CDRRecord.record_index)
-            .all()
-        )
-        records_data = []
-        for r in all_records:
-            data = r.get_raw_data()
-            if "calling_number" not in data:
-                data["calling_number"] = r.calling_number
-            records_data.append(data)
-        parser.save_records_to_file(filepath, records_data)
-
         flash("Record deleted successfully", "success")
     except Exception as e:
         logging.error(f"Error deleting record: {str(e)}")
@@ -494,17 +546,19 @@ def delete_record(record_id):
 @app.route("/delete/<int:file_id>", methods=["POST"])
 def delete_file(file_id):
     cdr_file = CDRFile.query.get_or_404(file_id)
+    if active_job(file_id) is not None:
+        flash("File is still being parsed; try again when the job finishes", "error")
+        return redirect(url_for("view_results", file_id=file_id))
 
     try:
-        # Delete the physical file
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], cdr_file.filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-
         # Delete from database (records will be deleted due to cascade)
+        filename = cdr_file.filename
         db.session.delete(cdr_file)
         db.session.commit()
 
+        # Then the physical file, unless another upload shares it
+        release_upload(filename)
+
         flash("File deleted successfully", "success")
     except Exception as e:
         logging.error(f"Error deleting file: {str(e)}")
@@ -517,6 +571,9 @@ def delete_file(file_id):
 def save_as(file_id):
     """Save the parsed records to a new file and database entry."""
     cdr_file = CDRFile.query.get_or_404(file_id)
+    if active_session(file_id) is not None:
+        flash("Apply or discard the open edit session before saving", "error")
+        return redirect(url_for("view_results", file_id=file_id))
 
     if request.method == "POST":
         new_name = request.form.get("filename", "").strip()
@@ -554,52 +611,121 @@ def save_as(file_id):
             flash("File already exists", "error")
             return redirect(request.url)
 
-        # Copy the original file first
         original_path = os.path.join(app.config["UPLOAD_FOLDER"], cdr_file.filename)
-        shutil.copy2(original_path, new_path)
         parser = CDRParser(spec_path=cdr_file.spec_path, top_type="CallDataRecord")
-        selected_records = (
-            CDRRecord.query.filter_by(file_id=cdr_file.id)
-            .filter(CDRRecord.record_index >= start_idx)
-            .filter(CDRRecord.record_index <= end_idx)
+        in_range = (
+            CDRRecord.file_id == cdr_file.id,
+            CDRRecord.record_index.between(start_idx, end_idx),
+        )
+        selected = (
+            db.session.query(
+                CDRRecord.record_index, CDRRecord.record_offset, CDRRecord.record_length
+            )
+            .filter(*in_range)
             .order_by(CDRRecord.record_index)
             .all()
         )
-        records_data = []
-        for r in selected_records:
-            data = r.get_raw_data()
-            if "calling_number" not in data:
-                data["calling_number"] = r.calling_number
-            records_data.append(data)
+        if not selected:
+            flash("No records in the selected range", "error")
+            return redirect(request.url)
 
-        parser.save_records_to_file(new_path, records_data)
-        file_size = os.path.getsize(new_path)
+        # Records stored before offsets were kept are located through the
+        # index; created records have no bytes in the file and are skipped
+        index = None
+        located = []
+        for record_index, offset, length in selected:
+            if offset is None or not length:
+                if index is None:
+                    index = parser.get_record_index(original_path)
+                if index is None or record_index >= len(index):
+                    continue
+                entry = index.entry(record_index)
+                offset, length = entry.offset, entry.length
+            located.append((record_index, offset, length))
+
+        new_offsets = parser.splice_records(
+            original_path, new_path, [(offset, length) for _, offset, length in located]
+        )
+        parser.get_record_index(new_path)
 
         new_file = CDRFile(
             filename=new_filename,
             original_filename=new_filename,
-            file_size=file_size,
+            file_size=os.path.getsize(new_path),
             parse_status="success",
-            records_count=len(records_data),
+            records_count=len(selected),
+            parse_offset=new_offsets[-1] + located[-1][2] if located else 0,
             spec_path=cdr_file.spec_path,
         )
+        if parser.read_container_layout(new_path):
+            new_file.set_file_metadata(parser.file_metadata)
+        new_file.adjust_record_type_counts(
+            dict(
+                db.session.query(CDRRecord.record_type, db.func.count(CDRRecord.id))
+                .filter(*in_range)
+                .group_by(CDRRecord.record_type)
+                .all()
+            )
+        )
         db.session.add(new_file)
-        db.session.commit()
-
-        for i, r in enumerate(selected_records):
-            new_record = CDRRecord(
-                file_id=new_file.id,
-                record_index=i,
-                record_type=r.record_type,
-                calling_number=r.calling_number,
-                called_number=r.called_number,
-                call_duration=r.call_duration,
-                start_time=r.start_time,
-                end_time=r.end_time,
+        db.session.flush()
+
+        # Offsets shift by a constant within each run of records copied together
+        shifts = []
+        for (record_index, offset, _), new_offset in zip(located, new_offsets):
+            if shifts and shifts[-1][2] == new_offset - offset:
+                shifts[-1][1] = record_index
+            else:
+                shifts.append([record_index, record_index, new_offset - offset])
+        columns = CDRRecord.__table__.c
+        new_record_offset = db.null()
+        if shifts:
+            new_record_offset = db.case(
+                *(
+                    (columns.record_index.between(first, last), columns.record_offset + shift)
+                    for first, last, shift in shifts
+                ),
+                else_=db.null(),
             )
-            new_record.set_raw_data(r.get_raw_data())
-            db.session.add(new_record)
 
+        # Clone the rows in one INSERT ... SELECT, renumbered from 0
+        clone = db.select(
+            db.literal(new_file.id),
+            db.func.row_number().over(order_by=columns.record_index) - 1,
+            columns.record_type,
+            columns.calling_number,
+            columns.called_number,
+            columns.call_duration,
+            columns.start_time,
+            columns.end_time,
+            columns.start_epoch,
+            columns.end_epoch,
+            columns.raw_data,
+            columns.raw_data_z,
+            new_record_offset,
+            columns.record_length,
+        ).where(*in_range)
+        db.session.execute(
+            CDRRecord.__table__.insert().from_select(
+                [
+                    "file_id",
+                    "record_index",
+                    "record_type",
+                    "calling_number",
+                    "called_number",
+                    "call_duration",
+                    "start_time",
+                    "end_time",
+                    "start_epoch",
+                    "end_epoch",
+                    "raw_data",
+                    "raw_data_z",
+                    "record_offset",
+                    "record_length",
+                ],
+                clone,
+            )
+        )
         db.session.commit()
         flash(f"File saved as {new_filename}", "success")
         return redirect(url_for("view_results", file_id=new_file.id))
@@ -611,6 +737,9 @@ def save_as(file_id):
 def parse_next(file_id):
 
     cdr_file = CDRFile.query.get_or_404(file_id)
+    if active_job(file_id) is not None:
+        flash("File is already being parsed in the background", "info")
+        return redirect(url_for("view_results", file_id=file_id))
     start_index = CDRRecord.query.filter_by(file_id=file_id).count()
     filepath = os.path.join(app.config["UPLOAD_FOLDER"], cdr_file.filename)
 
@@ -627,23 +756,9 @@ def parse_next(file_id):
         flash("No more records found", "info")
         return redirect(url_for("view_results", file_id=file_id))
 
-    for i, record in enumerate(records):
-        cdr_record = CDRRecord(
-            file_id=file_id,
-            record_index=start_index + i,
-            record_type=record.get("record_type", "unknown"),
-            calling_number=record.get("calling_number"),
-            called_number=record.get("called_number"),
-            call_duration=record.get("call_duration"),
-            start_time=record.get("start_time"),
-            end_time=record.get("end_time"),
-        )
-        cdr_record.set_raw_data(record)
-        db.session.add(cdr_record)
-
-    cdr_file.records_count = start_index + len(records)
-    cdr_file.parse_offset = new_offset
-    db.session.commit()
+    insert_records(cdr_file, records, start_index, new_offset)
+    with metrics.timer("db_commit"):
+        db.session.commit()
     if reached_end:
         flash(
             f"Parsed {len(records)} records and reached end of file",
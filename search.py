@@ -0,0 +1,111 @@
+"""Indexed substring search over calling and called numbers.
+
+SQLite databases get an external-content FTS5 table with the trigram
+tokenizer, kept in sync with ``cdr_record`` by triggers. PostgreSQL gets
+``pg_trgm`` GIN indexes, which serve ``LIKE '%...%'`` directly. Either way a
+substring or suffix lookup of three or more characters is an index probe
+instead of a scan of every record.
+"""
+
+import logging
+
+from app import db
+from models import CDRRecord
+
+# Trigram indexes cannot answer shorter patterns
+MIN_INDEXED_SEARCH = 3
+
+FTS_TABLE = "cdr_record_numbers"
+
+SQLITE_FTS_SETUP = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        calling_number, called_number,
+        content='cdr_record', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON cdr_record BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, calling_number, called_number)
+        VALUES (new.id, new.calling_number, new.called_number);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON cdr_record BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, calling_number, called_number)
+        VALUES ('delete', old.id, old.calling_number, old.called_number);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF calling_number, called_number
+        ON cdr_record BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, calling_number, called_number)
+        VALUES ('delete', old.id, old.calling_number, old.called_number);
+        INSERT INTO {FTS_TABLE}(rowid, calling_number, called_number)
+        VALUES (new.id, new.calling_number, new.called_number);
+    END""",
+    # Index rows inserted before the table existed
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRES_TRGM_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_cdr_record_calling_trgm "
+    "ON cdr_record USING gin (calling_number gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_cdr_record_called_trgm "
+    "ON cdr_record USING gin (called_number gin_trgm_ops)",
+]
+
+# Set by init_search: "fts5", "pg_trgm" or None when only LIKE is available
+search_backend = None
+
+
+def init_search():
+    """Create the search index for the current database if it is missing."""
+    global search_backend
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            exists = db.session.execute(
+                db.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                {"name": FTS_TABLE},
+            ).first()
+            if not exists:
+                for statement in SQLITE_FTS_SETUP:
+                    db.session.execute(db.text(statement))
+                db.session.commit()
+            search_backend = "fts5"
+        elif dialect == "postgresql":
+            for statement in POSTGRES_TRGM_SETUP:
+                db.session.execute(db.text(statement))
+            db.session.commit()
+            search_backend = "pg_trgm"
+    except Exception as e:
+        # e.g. SQLite without the trigram tokenizer or no rights for CREATE EXTENSION
+        db.session.rollback()
+        logging.warning(f"Number search index unavailable, using LIKE: {str(e)}")
+        search_backend = None
+
+
+def refresh_search_stats():
+    """Update planner statistics after a bulk load.
+
+    Without them SQLite walks every record of a file through the
+    ``(file_id, record_index)`` index instead of probing the few ids the
+    trigram index returns.
+    """
+    try:
+        db.session.execute(db.text("ANALYZE cdr_record"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.warning(f"Could not analyze cdr_record: {str(e)}")
+
+
+def number_filter(search_query):
+    """Return a filter matching records whose numbers contain ``search_query``."""
+    if search_backend == "fts5" and len(search_query) >= MIN_INDEXED_SEARCH:
+        # A quoted FTS5 string matches as a substring under the trigram tokenizer
+        phrase = '"' + search_query.replace('"', '""') + '"'
+        matches = db.select(db.column("rowid")).select_from(db.table(FTS_TABLE)).where(
+            db.text(f"{FTS_TABLE} MATCH :phrase").bindparams(phrase=phrase)
+        )
+        return CDRRecord.id.in_(matches)
+
+    return db.or_(
+        CDRRecord.calling_number.contains(search_query, autoescape=True),
+        CDRRecord.called_number.contains(search_query, autoescape=True),
+    )
@@ -0,0 +1,143 @@
+"""Content-addressed storage of uploaded files.
+
+Uploads are written to ``UPLOAD_FOLDER/<sha256><ext>``, with the digest
+computed while the request body is streamed to disk, so identical uploads
+are stored once and can reuse the records already parsed from them. A stored
+file is shared by every CDRFile uploaded with the same content; before one of
+them is patched in place it is given a private copy with
+:func:`detach_upload`.
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+from werkzeug.utils import secure_filename
+
+from app import app, db
+from models import CDRFile
+from cdr_parser import CDRParser
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload(upload):
+    """Store a werkzeug ``FileStorage`` under the hash of its content.
+
+    Returns ``(filename, digest, size)``. When a file with the same content
+    is already stored, the new copy is discarded.
+    """
+    folder = app.config["UPLOAD_FOLDER"]
+    extension = os.path.splitext(secure_filename(upload.filename))[1].lower()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: upload.stream.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        filename = digest.hexdigest() + extension
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename, digest.hexdigest(), size
+
+
+def find_parsed_upload(digest, spec_path):
+    """Return the file already parsed from the same content and spec, if any."""
+    return (
+        CDRFile.query.filter_by(content_hash=digest, spec_path=spec_path)
+        .filter(CDRFile.parse_status.in_(("success", "processing")))
+        .order_by(CDRFile.id)
+        .first()
+    )
+
+
+def shares_upload(cdr_file):
+    """Whether another CDRFile uses the same stored file."""
+    return upload_in_use(cdr_file.filename, exclude_id=cdr_file.id)
+
+
+def upload_in_use(filename, exclude_id=None):
+    """Whether a CDRFile other than ``exclude_id`` uses the stored ``filename``."""
+    query = CDRFile.query.filter(CDRFile.filename == filename)
+    if exclude_id is not None:
+        query = query.filter(CDRFile.id != exclude_id)
+    return query.with_entities(CDRFile.id).first() is not None
+
+
+def detach_upload(cdr_file):
+    """Give ``cdr_file`` a private copy of its upload before it is modified.
+
+    The stored file and its sidecar index are hard-linked to a private name
+    when no other CDRFile uses them and copied otherwise. The new name is
+    committed before the shared name is unlinked, so an interruption never
+    leaves the row pointing at a missing file. Whether the shared name is
+    still unused is checked again after that commit: an upload of the same
+    content may have started using it, in which case the private hard links
+    are replaced by copies and the shared name is kept. Files that are not
+    stored by content hash are left alone.
+    """
+    if cdr_file.content_hash is None:
+        return
+    folder = app.config["UPLOAD_FOLDER"]
+    stem, extension = os.path.splitext(cdr_file.filename)
+    private_name = f"{stem}-{cdr_file.id}{extension}"
+    parser = CDRParser()
+    source = os.path.join(folder, cdr_file.filename)
+    target = os.path.join(folder, private_name)
+    moves = [(source, target), (parser.index_path(source), parser.index_path(target))]
+
+    shared = shares_upload(cdr_file)
+    for source, target in moves:
+        if not os.path.exists(source):
+            continue
+        if os.path.exists(target):
+            os.remove(target)
+        if shared:
+            shutil.copyfile(source, target)
+        else:
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+
+    shared_name = cdr_file.filename
+    cdr_file.filename = private_name
+    cdr_file.content_hash = None
+    db.session.commit()
+
+    if shared:
+        return
+    if upload_in_use(shared_name):
+        # The links would let patches of the private copy reach the other file
+        for source, target in moves:
+            if os.path.exists(source):
+                tmp_path = f"{target}.part"
+                shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, target)
+        return
+    release_upload(shared_name)
+
+
+def release_upload(filename):
+    """Unlink a stored file and its index unless a CDRFile still uses them.
+
+    Callers commit the row change that released ``filename`` first, so the
+    check sees uploads of the same content that started in the meantime.
+    """
+    if upload_in_use(filename):
+        return
+    path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    for stale in (path, CDRParser().index_path(path)):
+        if os.path.exists(stale):
+            os.remove(stale)